@@ -1,16 +1,21 @@
 import pandas as pd
-import numpy as np
+import pyarrow.csv as pv
+import pyarrow.compute as pc
 
 def load_income_data(file_path: str) -> pd.DataFrame:
     """Load and process the income data CSV file."""
-    # Read the CSV with semicolon separator
-    df = pd.read_csv(file_path, sep=';')
+    # Read only the needed columns of the semicolon separated CSV
+    table = pv.read_csv(
+        file_path,
+        parse_options=pv.ParseOptions(delimiter=';'),
+        convert_options=pv.ConvertOptions(include_columns=['GEO_ID', 'GEO_NAME', 'VARIABLE', 'VALUE'])
+    )
     
     # Filter for per capita income data
-    df = df[df['VARIABLE'] == 'Steuerbares Einkommen pro Einwohner/-in, in Franken']
+    table = table.filter(pc.equal(table['VARIABLE'], 'Steuerbares Einkommen pro Einwohner/-in, in Franken'))
     
     # Select and rename relevant columns
-    df = df[['GEO_ID', 'GEO_NAME', 'VALUE']]
+    df = table.select(['GEO_ID', 'GEO_NAME', 'VALUE']).to_pandas()
     df = df.rename(columns={
         'GEO_ID': 'municipality_id',
         'GEO_NAME': 'municipality',
@@ -21,7 +26,7 @@ def load_income_data(file_path: str) -> pd.DataFrame:
 
 def load_migros_data(file_path: str) -> pd.DataFrame:
     """Load the processed Migros facilities data."""
-    return pd.read_csv(file_path)
+    return pd.read_parquet(file_path)
 
 def analyze_income_data(income_df: pd.DataFrame):
     """Perform basic analysis on the income data."""
@@ -35,24 +40,24 @@ def analyze_income_data(income_df: pd.DataFrame):
     print(f"Maximum income per capita: {income_df['income_per_capita'].max():.2f} CHF")
     
     print("\n=== Top 10 Municipalities by Income ===")
-    top_10 = income_df.nlargest(10, 'income_per_capita')
-    print(top_10[['municipality', 'income_per_capita']].to_string(index=False))
+    top_10 = income_df.loc[income_df['income_per_capita'].nlargest(10).index, ['municipality', 'income_per_capita']]
+    print(top_10.to_string(index=False))
     
     print("\n=== Bottom 10 Municipalities by Income ===")
-    bottom_10 = income_df.nsmallest(10, 'income_per_capita')
-    print(bottom_10[['municipality', 'income_per_capita']].to_string(index=False))
+    bottom_10 = income_df.loc[income_df['income_per_capita'].nsmallest(10).index, ['municipality', 'income_per_capita']]
+    print(bottom_10.to_string(index=False))
 
 def main():
     # Load and process the data
     income_df = load_income_data('Durchschnittliches steuerbares Einkommen.csv')
-    migros_df = load_migros_data('processed_migros_facilities.csv')
+    migros_df = load_migros_data('processed_migros_facilities.parquet')
     
     # Perform analysis
     analyze_income_data(income_df)
     
     # Save processed income data
-    income_df.to_csv('processed_income_data.csv', index=False)
-    print("\nProcessed income data saved to 'processed_income_data.csv'")
+    income_df.to_parquet('processed_income_data.parquet', compression='zstd', index=False)
+    print("\nProcessed income data saved to 'processed_income_data.parquet'")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,6 +1,7 @@
-import json
+import ijson
 import pandas as pd
-from typing import Dict, List
+from itertools import islice
+from typing import Dict, Iterable, Iterator
 
 # Type mapping
 TYPE_MAP = {
@@ -34,44 +35,73 @@ TYPE_MAP = {
     }
 }
 
-def load_migros_data(file_path: str) -> List[Dict]:
-    """Load and parse the Migros filial data from JSON file."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return data['data']['facilities']['results']
+# Low-cardinality string columns stored as categoricals
+CATEGORICAL_COLUMNS = ['type', 'type_name', 'type_description', 'city', 'country']
 
-def check_unknown_types(facilities: List[Dict]) -> Dict[str, List[Dict]]:
+# Facility fields kept from the JSON records, flattened by json_normalize
+# (same loader as processing/scripts/process_migros_branches.py, keep both in sync)
+FACILITY_FIELDS = [
+    'id', 'name', 'type', 'location.address', 'location.zip', 'location.city',
+    'location.country', 'location.geo.lat', 'location.geo.lon'
+]
+# Number of facility records flattened at a time
+FACILITY_CHUNK_SIZE = 1000
+
+def load_migros_data(file_path: str) -> Iterator[Dict]:
+    """Stream the Migros filial data from JSON file one facility at a time."""
+    with open(file_path, 'rb') as f:
+        yield from ijson.items(f, 'data.facilities.results.item', use_float=True)
+
+def check_unknown_types(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     """Check for facilities with unknown types and return them grouped by type."""
-    unknown_types = {}
-    for facility in facilities:
-        if facility['type'] not in TYPE_MAP:
-            if facility['type'] not in unknown_types:
-                unknown_types[facility['type']] = []
-            unknown_types[facility['type']].append(facility)
-    return unknown_types
+    unknown = df[~df['type'].isin(TYPE_MAP)]
+    return {type_code: group for type_code, group in unknown.groupby('type', observed=True, sort=False)}
+
+def normalize_facilities(facilities: Iterable[Dict]) -> pd.DataFrame:
+    """Flatten the facility records in chunks so only one chunk of dicts is held at a time."""
+    facilities = iter(facilities)
+    chunks = []
+    while True:
+        chunk = list(islice(facilities, FACILITY_CHUNK_SIZE))
+        if not chunk:
+            break
+        chunks.append(pd.json_normalize(chunk).reindex(columns=FACILITY_FIELDS))
+    if not chunks:
+        return pd.DataFrame(columns=FACILITY_FIELDS)
+    return pd.concat(chunks, ignore_index=True)
 
-def create_dataframe(facilities: List[Dict]) -> pd.DataFrame:
+def create_dataframe(facilities: Iterable[Dict]) -> pd.DataFrame:
     """Create a pandas DataFrame from the facilities data."""
-    rows = []
-    for facility in facilities:
-        row = {
-            'id': facility['id'],
-            'name': facility['name'],
-            'type': facility['type'],
-            'type_name': TYPE_MAP.get(facility['type'], {}).get('name', 'Unknown'),
-            'type_description': TYPE_MAP.get(facility['type'], {}).get('description', 'Unknown'),
-            'address': facility['location']['address'],
-            'zip_code': facility['location']['zip'],
-            'city': facility['location']['city'],
-            'country': facility['location']['country'],
-            'latitude': facility['location']['geo']['lat'],
-            'longitude': facility['location']['geo']['lon']
-        }
-        rows.append(row)
+    df = normalize_facilities(facilities)
+    df = df.rename(columns={
+        'location.address': 'address',
+        'location.zip': 'zip_code',
+        'location.city': 'city',
+        'location.country': 'country',
+        'location.geo.lat': 'latitude',
+        'location.geo.lon': 'longitude'
+    })
+    
+    # Look up type name and description for all rows at once
+    type_df = pd.DataFrame.from_dict(TYPE_MAP, orient='index').rename(columns={
+        'name': 'type_name',
+        'description': 'type_description'
+    })
+    df = df.join(type_df, on='type')
+    df[['type_name', 'type_description']] = df[['type_name', 'type_description']].fillna('Unknown')
+    
+    df = df[[
+        'id', 'name', 'type', 'type_name', 'type_description', 'address',
+        'zip_code', 'city', 'country', 'latitude', 'longitude'
+    ]]
     
-    return pd.DataFrame(rows)
+    # Store repeated string columns as categoricals
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+    
+    return df
 
-def analyze_data(df: pd.DataFrame, unknown_types: Dict[str, List[Dict]]):
+def analyze_data(df: pd.DataFrame, unknown_types: Dict[str, pd.DataFrame]):
     """Perform basic analysis on the Migros facilities data."""
     print("\n=== Basic Statistics ===")
     print(f"Total number of facilities: {len(df)}")
@@ -90,25 +120,25 @@ def analyze_data(df: pd.DataFrame, unknown_types: Dict[str, List[Dict]]):
             print(f"\nType code: '{type_code}'")
             print(f"Number of facilities: {len(facilities)}")
             print("Example facilities:")
-            for facility in facilities[:3]:  # Show first 3 examples
-                print(f"- {facility['name']} ({facility['id']}) in {facility['location']['city']}")
+            for facility in facilities.head(3).itertuples(index=False):  # Show first 3 examples
+                print(f"- {facility.name} ({facility.id}) in {facility.city}")
 
 def main():
     # Load and process the data
     facilities = load_migros_data('migrosfilialen.json')
     
-    # Check for unknown types
-    unknown_types = check_unknown_types(facilities)
-    
     # Create DataFrame
     df = create_dataframe(facilities)
     
+    # Check for unknown types
+    unknown_types = check_unknown_types(df)
+    
     # Perform analysis
     analyze_data(df, unknown_types)
     
-    # Save processed data to CSV
-    df.to_csv('processed_migros_facilities.csv', index=False)
-    print("\nProcessed data saved to 'processed_migros_facilities.csv'")
+    # Save processed data to Parquet
+    df.to_parquet('processed_migros_facilities.parquet', compression='zstd', index=False)
+    print("\nProcessed data saved to 'processed_migros_facilities.parquet'")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,13 +1,17 @@
 import pandas as pd
-import numpy as np
+import pyarrow.csv as pv
 
 def load_population_data(file_path: str) -> pd.DataFrame:
     """Load and process the population data CSV file."""
-    # Read the CSV with semicolon separator
-    df = pd.read_csv(file_path, sep=';')
+    # Read only the needed columns of the semicolon separated CSV
+    table = pv.read_csv(
+        file_path,
+        parse_options=pv.ParseOptions(delimiter=';'),
+        convert_options=pv.ConvertOptions(include_columns=['ERHJAHR', 'GDENR', 'GDEHISTID', 'GTOT'])
+    )
     
-    # Select and rename relevant columns
-    df = df[['ERHJAHR', 'GDENR', 'GDEHISTID', 'GTOT']]
+    # Rename relevant columns
+    df = table.to_pandas()
     df = df.rename(columns={
         'ERHJAHR': 'year',
         'GDENR': 'municipality_id',
@@ -30,11 +34,11 @@ def analyze_population_data(df: pd.DataFrame):
     print(f"Maximum population: {df['total_population'].max()}")
     
     print("\n=== Top 10 Municipalities by Population ===")
-    top_10 = df.nlargest(10, 'total_population')
+    top_10 = df.loc[df['total_population'].nlargest(10).index]
     print(top_10.to_string(index=False))
     
     print("\n=== Bottom 10 Municipalities by Population ===")
-    bottom_10 = df.nsmallest(10, 'total_population')
+    bottom_10 = df.loc[df['total_population'].nsmallest(10).index]
     print(bottom_10.to_string(index=False))
 
 def main():
@@ -45,8 +49,8 @@ def main():
     analyze_population_data(pop_df)
     
     # Save processed data
-    pop_df.to_csv('processed_population_data.csv', index=False)
-    print("\nProcessed population data saved to 'processed_population_data.csv'")
+    pop_df.to_parquet('processed_population_data.parquet', compression='zstd', index=False)
+    print("\nProcessed population data saved to 'processed_population_data.parquet'")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,17 +1,18 @@
 import pandas as pd
-import numpy as np
 import os
 
 def load_processed_data():
     """Load all processed data files."""
     # Load Migros branches data
-    branches_df = pd.read_csv('../output/processed_migros_branches.csv')
+    branches_df = pd.read_parquet('../output/processed_migros_branches.parquet')
+    # Parquet keeps the zero-padded ID strings; the isochrone results are keyed by numeric ID
+    branches_df['id'] = branches_df['id'].astype(int)
     
     # Load population data
-    population_df = pd.read_csv('../output/processed_population_data.csv')
+    population_df = pd.read_parquet('../output/processed_population_data.parquet')
     
     # Load income data
-    income_df = pd.read_csv('../output/processed_income_data.csv')
+    income_df = pd.read_parquet('../output/processed_income_data.parquet')
     
     return branches_df, population_df, income_df
 
@@ -19,16 +20,16 @@ def combine_data(branches_df: pd.DataFrame, population_df: pd.DataFrame, income_
     """Combine all data sources and prepare for analysis."""
     # First, combine population and income data
     # Note: We'll need to handle municipality ID matching carefully
-    combined_df = pd.merge(
-        population_df,
-        income_df,
-        on='municipality_id',
+    # The municipality name comes along with the income columns
+    combined_df = population_df.set_index('municipality_id').join(
+        income_df.set_index('municipality_id'),
         how='outer'
-    )
+    ).reset_index()
     
-    # Add municipality name if available
-    if 'municipality' in income_df.columns:
-        combined_df['municipality'] = income_df['municipality']
+    # Keep the population columns first
+    combined_df = combined_df[
+        list(population_df.columns) + [c for c in income_df.columns if c != 'municipality_id']
+    ]
     
     # Calculate population density (if we have area data)
     # This will be added later when we have the area data
@@ -91,11 +92,13 @@ def main():
     # Save combined data
     combined_df.to_csv('../output/combined_municipality_data.csv', index=False)
     geospatial_df.to_csv('../output/geospatial_branches_data.csv', index=False)
+    geospatial_df.to_parquet('../output/geospatial_branches_data.parquet', compression='zstd', index=False)
     
     print("\nData processing complete!")
     print("Saved files:")
     print("- combined_municipality_data.csv: Combined population and income data")
     print("- geospatial_branches_data.csv: Prepared data for OpenRouteService integration")
+    print("- geospatial_branches_data.parquet: Same data for the pilot branch selector")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,10 +1,9 @@
 import pandas as pd
-import folium
-from folium.plugins import HeatMap, FeatureGroupSubGroup
-import branca.colormap as cm
 import os
 import json
-import geopandas as gpd
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+import shapely
 from shapely.geometry import shape
 import numpy as np
 
@@ -16,20 +15,53 @@ BRANCH_COLORS = {
     'VOI': '#F333FF'   # Purple
 }
 
+# Random generator for heatmap point sampling (seeded for reproducible maps)
+RNG = np.random.default_rng(42)
+
+# Helper to extract the geometry of the first isochrone feature
+def _isochrone_geometry(item):
+    features = item.get('isochrone_data', {}).get('features')
+    return features[0]['geometry'] if features else None
+
+# Helpers to build GeoJSON features that carry their own styling
+def _feature(geometry, **properties):
+    return {'type': 'Feature', 'geometry': geometry, 'properties': properties}
+
+def _feature_style(feature):
+    properties = feature['properties']
+    return {
+        'fillColor': properties['color'],
+        'color': properties['color'],
+        'fillOpacity': properties['fill_opacity'],
+        'weight': properties['weight']
+    }
+
+# Helper to convert a column of GeoJSON geometries (or NaN) into a GeoSeries
+def _to_geoseries(geojson_column):
+    import geopandas as gpd
+    return gpd.GeoSeries(
+        [shape(geometry) if pd.notna(geometry) else None for geometry in geojson_column],
+        index=geojson_column.index
+    )
+
 # Helper to load and merge data
 def load_data():
-    scores_df = pd.read_csv('../output/location_scores.csv')
-    geo_df = pd.read_csv('../output/geospatial_branches_data.csv')
+    scores_df = pd.read_csv('../output/location_scores.csv', dtype={'branch_type': 'category'})
+    geo_df = pd.read_csv(
+        '../output/geospatial_branches_data.csv',
+        usecols=['id', 'latitude', 'longitude'],
+        dtype={'id': 'int64', 'latitude': 'float64', 'longitude': 'float64'}
+    )
     
     # Load isochrone data
-    with open('../output/isochrone_results_10min.json', 'r') as f:
-        isochrone_10min = json.load(f)
-    with open('../output/isochrone_results_20min.json', 'r') as f:
-        isochrone_20min = json.load(f)
+    with open('../output/isochrone_results_10min.json', 'rb') as f:
+        isochrone_10min = orjson.loads(f.read())
+    with open('../output/isochrone_results_20min.json', 'rb') as f:
+        isochrone_20min = orjson.loads(f.read())
     
-    # Create lookup dictionaries for isochrone data
-    isochrone_10min_dict = {item['branch_id']: item for item in isochrone_10min}
-    isochrone_20min_dict = {item['branch_id']: item for item in isochrone_20min}
+    # Create lookup dictionaries from branch ID to isochrone geometry
+    isochrone_10min_geom = {item['branch_id']: _isochrone_geometry(item) for item in isochrone_10min}
+    isochrone_20min_geom = {item['branch_id']: _isochrone_geometry(item) for item in isochrone_20min}
     
     # Merge data
     merged_df = pd.merge(
@@ -40,9 +72,9 @@ def load_data():
         how='left'
     )
     
-    # Add isochrone data to merged dataframe
-    merged_df['isochrone_10min'] = merged_df['branch_id'].map(lambda x: isochrone_10min_dict.get(x, {}).get('isochrone_data', {}))
-    merged_df['isochrone_20min'] = merged_df['branch_id'].map(lambda x: isochrone_20min_dict.get(x, {}).get('isochrone_data', {}))
+    # Add isochrone geometries to merged dataframe
+    merged_df['isochrone_10min_geom'] = merged_df['branch_id'].map(isochrone_10min_geom)
+    merged_df['isochrone_20min_geom'] = merged_df['branch_id'].map(isochrone_20min_geom)
     
     return merged_df
 
@@ -55,7 +87,7 @@ def load_selected_branch_ids():
     except FileNotFoundError:
         return set()
 
-def generate_heatmap_points(geometry, population, num_points=100):
+def generate_heatmap_points(geometry, population, num_points=100, rng=RNG):
     """Generate points within a geometry for heatmap visualization."""
     if not geometry:
         return []
@@ -64,27 +96,93 @@ def generate_heatmap_points(geometry, population, num_points=100):
     if isinstance(geometry, dict):
         geometry = shape(geometry)
     
+    # Points, lines and empty geometries have no area to place points in
+    if geometry.is_empty or geometry.area == 0:
+        return []
+    
+    # Prepare the geometry for the batched containment test below
+    shapely.prepare(geometry)
+    
     # Get bounds
     minx, miny, maxx, maxy = geometry.bounds
     
-    points = []
-    attempts = 0
-    max_attempts = num_points * 10  # Allow more attempts to ensure we get enough points
+    # Share of the bounding box covered by the geometry, i.e. the expected hit rate
+    hit_rate = geometry.area / ((maxx - minx) * (maxy - miny))
+    
+    # Draw all candidate points in one batch, sized for the expected hit rate
+    # (capped at the previous attempt limit of 10 candidates per point)
+    num_candidates = min(int(np.ceil(num_points / hit_rate * 1.5)), num_points * 10)
+    xs = rng.uniform(minx, maxx, size=num_candidates)
+    ys = rng.uniform(miny, maxy, size=num_candidates)
+    
+    # Keep the first points that fall within the geometry
+    inside = shapely.contains_xy(geometry, xs, ys)
+    xs = xs[inside][:num_points]
+    ys = ys[inside][:num_points]
+    
+    # Note: folium uses [lat, lon]
+    return np.column_stack([ys, xs, np.full(len(xs), population / num_points)]).tolist()
+
+def build_branch_layers(branch, color, income_color, rng):
+    """Build the marker, service area and income features and the heatmap points of one branch."""
+    popup_text = f"""
+    <b>{branch.branch_name}</b><br>
+    Type: {branch.branch_type}<br>
+    Score: {branch.total_score:.2f}<br>
+    Population (10min): {branch.inner_population:.0f}<br>
+    Population (20min): {branch.outer_population:.0f}<br>
+    Income: {branch.income_per_capita:.0f} CHF
+    """
     
-    while len(points) < num_points and attempts < max_attempts:
-        # Generate random point within bounds
-        x = np.random.uniform(minx, maxx)
-        y = np.random.uniform(miny, maxy)
+    # Branch marker
+    branch_feature = _feature(
+        {'type': 'Point', 'coordinates': [branch.longitude, branch.latitude]},
+        color=color, fill_opacity=0.8, weight=3, popup=popup_text
+    )
+    service_area_features = []
+    income_features = []
+    heatmap_points = []
+
+    # The map layers reuse the GeoJSON as loaded, the sampling uses the shapely geometries
+    geometry_10min = branch.geometry_10min
+    geometry_20min = branch.geometry_20min
+    geojson_10min = branch.isochrone_10min_geom
+    geojson_20min = branch.isochrone_20min_geom
+
+    # Service areas using actual isochrone data
+    if geometry_20min is not None:
+        # 20-minute service area
+        service_area_features.append(_feature(geojson_20min, color=color, fill_opacity=0.08, weight=1))
         
-        # Check if point is within geometry
-        if geometry.contains(shape({'type': 'Point', 'coordinates': [x, y]})):
-            points.append([y, x, population / num_points])  # Note: folium uses [lat, lon]
+        # Heatmap points for outer area (20min - 10min)
+        if branch.outer_geometry is not None:
+            outer_population = branch.outer_population - branch.inner_population
+            heatmap_points.extend(generate_heatmap_points(branch.outer_geometry, outer_population, num_points=50, rng=rng))
+
+    if geometry_10min is not None:
+        # 10-minute service area
+        service_area_features.append(_feature(geojson_10min, color=color, fill_opacity=0.18, weight=2))
         
-        attempts += 1
-    
-    return points
+        # Heatmap points for inner area (10min)
+        heatmap_points.extend(generate_heatmap_points(geometry_10min, branch.inner_population, num_points=100, rng=rng))
+
+    # Income distribution using actual service areas
+    if geometry_20min is not None:
+        # 20-minute service area with income color
+        income_features.append(_feature(geojson_20min, color=income_color, fill_opacity=0.15, weight=1))
+
+        # 10-minute service area with higher opacity
+        if geometry_10min is not None:
+            income_features.append(_feature(geojson_10min, color=income_color, fill_opacity=0.3, weight=1))
+
+    return branch_feature, service_area_features, income_features, heatmap_points
 
 def create_combined_map():
+    # Mapping libraries are only needed for rendering
+    import folium
+    from folium.plugins import HeatMap
+    import branca.colormap as cm
+
     output_dir = '../output/pilot_analysis'
     os.makedirs(output_dir, exist_ok=True)
     merged_df = load_data()
@@ -94,6 +192,15 @@ def create_combined_map():
     else:
         selected_branches = merged_df
 
+    # Convert the isochrone geometries and compute the outer rings (20min - 10min)
+    # for all branches at once
+    selected_branches = selected_branches.copy()
+    geometry_10min = _to_geoseries(selected_branches['isochrone_10min_geom'])
+    geometry_20min = _to_geoseries(selected_branches['isochrone_20min_geom'])
+    selected_branches['geometry_10min'] = geometry_10min
+    selected_branches['geometry_20min'] = geometry_20min
+    selected_branches['outer_geometry'] = geometry_20min.difference(geometry_10min)
+
     # Create base map
     m = folium.Map(location=[46.8182, 8.2275], zoom_start=8, control_scale=True)
 
@@ -107,91 +214,41 @@ def create_combined_map():
     fg_heatmap = folium.FeatureGroup(name='Population Coverage Heatmap', show=False)
     fg_income = folium.FeatureGroup(name='Income Distribution', show=False)
 
-    # Branch markers and service areas
+    # Branch markers and service areas, collected as GeoJSON features.
+    # The per-branch sampling runs in threads (GEOS and numpy release the GIL),
+    # each branch drawing from its own generator so the result does not depend on scheduling
+    branch_colors = selected_branches['branch_type'].map(BRANCH_COLORS).astype(object).fillna('gray').to_numpy()
+    income_colors = [income_colormap(income) for income in selected_branches['income_per_capita']]
+    rngs = RNG.spawn(len(selected_branches))
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(
+            build_branch_layers,
+            selected_branches.itertuples(index=False), branch_colors, income_colors, rngs
+        ))
+    
+    branch_features = []
+    service_area_features = []
+    income_features = []
     heatmap_data = []
-    for _, branch in selected_branches.iterrows():
-        popup_text = f"""
-        <b>{branch['branch_name']}</b><br>
-        Type: {branch['branch_type']}<br>
-        Score: {branch['total_score']:.2f}<br>
-        Population (10min): {branch['inner_population']:.0f}<br>
-        Population (20min): {branch['outer_population']:.0f}<br>
-        Income: {branch['income_per_capita']:.0f} CHF
-        """
-        
-        # Add branch marker
-        folium.CircleMarker(
-            location=[branch['latitude'], branch['longitude']],
-            radius=8,
-            color=BRANCH_COLORS.get(branch['branch_type'], 'gray'),
-            fill=True,
-            fill_opacity=0.8,
-            popup=folium.Popup(popup_text, max_width=300)
-        ).add_to(fg_branches)
-
-        # Add service areas using actual isochrone data
-        if branch['isochrone_20min'] and 'features' in branch['isochrone_20min']:
-            # 20-minute service area
-            geometry_20min = shape(branch['isochrone_20min']['features'][0]['geometry'])
-            folium.GeoJson(
-                geometry_20min.__geo_interface__,
-                style_function=lambda x: {
-                    'fillColor': BRANCH_COLORS.get(branch['branch_type'], 'gray'),
-                    'color': BRANCH_COLORS.get(branch['branch_type'], 'gray'),
-                    'fillOpacity': 0.08,
-                    'weight': 1
-                }
-            ).add_to(fg_service_areas)
-            
-            # Add heatmap points for outer area (20min - 10min)
-            if branch['isochrone_10min'] and 'features' in branch['isochrone_10min']:
-                geometry_10min = shape(branch['isochrone_10min']['features'][0]['geometry'])
-                outer_geometry = geometry_20min.difference(geometry_10min)
-                outer_population = branch['outer_population'] - branch['inner_population']
-                heatmap_data.extend(generate_heatmap_points(outer_geometry, outer_population, num_points=50))
-
-        if branch['isochrone_10min'] and 'features' in branch['isochrone_10min']:
-            # 10-minute service area
-            geometry_10min = shape(branch['isochrone_10min']['features'][0]['geometry'])
-            folium.GeoJson(
-                geometry_10min.__geo_interface__,
-                style_function=lambda x: {
-                    'fillColor': BRANCH_COLORS.get(branch['branch_type'], 'gray'),
-                    'color': BRANCH_COLORS.get(branch['branch_type'], 'gray'),
-                    'fillOpacity': 0.18,
-                    'weight': 2
-                }
-            ).add_to(fg_service_areas)
-            
-            # Add heatmap points for inner area (10min)
-            heatmap_data.extend(generate_heatmap_points(geometry_10min, branch['inner_population'], num_points=100))
-
-        # Income distribution using actual service areas
-        if branch['isochrone_20min'] and 'features' in branch['isochrone_20min']:
-            # 20-minute service area with income color
-            geometry_20min = shape(branch['isochrone_20min']['features'][0]['geometry'])
+    for branch_feature, branch_service_areas, branch_income, branch_heatmap in results:
+        branch_features.append(branch_feature)
+        service_area_features.extend(branch_service_areas)
+        income_features.extend(branch_income)
+        heatmap_data.extend(branch_heatmap)
+
+    # Add each layer as a single GeoJSON collection styled from its feature properties
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': branch_features},
+        style_function=_feature_style,
+        marker=folium.CircleMarker(radius=8, fill=True),
+        popup=folium.GeoJsonPopup(fields=['popup'], labels=False, max_width=300)
+    ).add_to(fg_branches)
+    for features, feature_group in [(service_area_features, fg_service_areas), (income_features, fg_income)]:
+        if features:
             folium.GeoJson(
-                geometry_20min.__geo_interface__,
-                style_function=lambda x: {
-                    'fillColor': income_colormap(branch['income_per_capita']),
-                    'color': income_colormap(branch['income_per_capita']),
-                    'fillOpacity': 0.15,
-                    'weight': 1
-                }
-            ).add_to(fg_income)
-
-            # 10-minute service area with higher opacity
-            if branch['isochrone_10min'] and 'features' in branch['isochrone_10min']:
-                geometry_10min = shape(branch['isochrone_10min']['features'][0]['geometry'])
-                folium.GeoJson(
-                    geometry_10min.__geo_interface__,
-                    style_function=lambda x: {
-                        'fillColor': income_colormap(branch['income_per_capita']),
-                        'color': income_colormap(branch['income_per_capita']),
-                        'fillOpacity': 0.3,
-                        'weight': 1
-                    }
-                ).add_to(fg_income)
+                {'type': 'FeatureCollection', 'features': features},
+                style_function=_feature_style
+            ).add_to(feature_group)
 
     # Add population coverage heatmap
     HeatMap(heatmap_data, radius=15, blur=10, min_opacity=0.3).add_to(fg_heatmap)
@@ -1,25 +1,112 @@
-import pandas as pd
-import numpy as np
+import csv
 import os
 import requests
-import json
-from typing import Dict, List, Set
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+from typing import Dict, List, Optional, Set
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import itertools
+import pickle
+import sys
+import threading
 import time
 
+# Attempts per isochrone request that ORS rejects with 429 Too Many Requests
+RATE_LIMIT_ATTEMPTS = 5
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` calls per `period` seconds."""
+    def __init__(self, rate: int, period: float = 60.0, burst: int = 1):
+        self.capacity = rate
+        # Start nearly empty so the workers cannot spend a full quota at startup
+        self.tokens = float(burst)
+        self.interval = period / rate  # Seconds to refill one token
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available and consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.interval
+            time.sleep(wait)
+
 class OpenRouteService:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
+    def __init__(self, api_keys: List[str], requests_per_minute: int = 20, max_workers: int = 8,
+                 cache_file: Optional[str] = None):
+        if not api_keys:
+            raise ValueError("At least one OpenRouteService API key is required")
+        self.api_keys = api_keys
+        self.max_workers = max_workers
+        # Requests are spread round-robin over the keys, each with its own quota
+        # (ORS free plan: 20 isochrone requests/minute)
+        self._key_cycle = itertools.cycle(api_keys)
+        self._key_lock = threading.Lock()
+        self.rate_limiters = {key: RateLimiter(requests_per_minute, 60.0) for key in api_keys}
         self.base_url = "https://api.openrouteservice.org"
+        
+        # Reuse one connection pool (and TLS session) for all requests
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        # 429 is retried in _request_isochrone so the retries also take a rate limit token
+        retry = Retry(total=5, backoff_factor=1,
+                      status_forcelist=[500, 502, 503, 504],
+                      allowed_methods=['POST'])
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                                   max_retries=retry))
+        
+        # Isochrones by rounded location (4 decimals ~ 11m), shared by co-located
+        # branches and persisted across runs
+        self.cache_file = cache_file
+        self._isochrone_cache: Dict[tuple, Dict] = {}
+        self._pending: Dict[tuple, Future] = {}
+        self._cache_lock = threading.Lock()
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                self._isochrone_cache = pickle.load(f)
     
     def get_isochrone(self, lat: float, lon: float, profile: str = "cycling-regular", 
                      range_type: str = "time", range: int = 1200) -> Dict:
         """Get isochrone (reachable area) for a given location."""
-        url = f"{self.base_url}/v2/isochrones/{profile}"
+        key = (round(lat, 4), round(lon, 4), profile, range_type, range)
+        with self._cache_lock:
+            if key in self._isochrone_cache:
+                return self._isochrone_cache[key]
+            pending = self._pending.get(key)
+            if pending is None:
+                future = self._pending[key] = Future()
         
-        headers = {
-            'Authorization': self.api_key,
-            'Content-Type': 'application/json'
-        }
+        if pending is not None:
+            # A co-located branch is already fetching this isochrone
+            return pending.result()
+        
+        try:
+            isochrone = self._request_isochrone(lat, lon, profile, range_type, range)
+        except Exception as e:
+            with self._cache_lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        
+        with self._cache_lock:
+            # Only cache successful responses, not ORS error messages
+            if 'features' in isochrone:
+                self._isochrone_cache[key] = isochrone
+            del self._pending[key]
+        future.set_result(isochrone)
+        return isochrone
+    
+    def _request_isochrone(self, lat: float, lon: float, profile: str,
+                           range_type: str, range: int) -> Dict:
+        """Request an isochrone from the OpenRouteService API."""
+        url = f"{self.base_url}/v2/isochrones/{profile}"
         
         body = {
             "locations": [[lon, lat]],
@@ -28,122 +115,148 @@ class OpenRouteService:
             "attributes": ["area", "reachfactor", "total_pop"]
         }
         
-        response = requests.post(url, headers=headers, json=body)
-        return response.json()
+        with self._key_lock:
+            api_key = next(self._key_cycle)
+        attempts = 0
+        while True:
+            self.rate_limiters[api_key].acquire()
+            response = self.session.post(url, json=body, headers={'Authorization': api_key}, timeout=30)
+            if response.status_code != 429:
+                return response.json()
+            attempts += 1
+            if attempts >= RATE_LIMIT_ATTEMPTS:
+                response.raise_for_status()
     
     def batch_process_locations(self, locations: List[Dict], output_file_20min: str, output_file_10min: str,
                               processed_20min: Set[str], processed_10min: Set[str]):
         """Process multiple locations and save results for both 10 and 20 minute ranges."""
-        results_20min = []
-        results_10min = []
-        
-        # Load existing results if they exist
-        existing_20min = []
-        existing_10min = []
-        if os.path.exists(output_file_20min):
-            with open(output_file_20min, 'r') as f:
-                existing_20min = json.load(f)
-        if os.path.exists(output_file_10min):
-            with open(output_file_10min, 'r') as f:
-                existing_10min = json.load(f)
+        # One task per (location, range) that still needs processing
+        tasks = [(loc, minutes) for loc in locations
+                 for minutes, processed in ((20, processed_20min), (10, processed_10min))
+                 if str(loc['id']) not in processed]
         
-        for idx, loc in enumerate(locations):
-            print(f"Processing location {idx + 1}/{len(locations)}: {loc['name']}")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._process_location, loc, minutes): (loc, minutes)
+                for loc, minutes in tasks
+            }
             
-            try:
-                # Process 20-minute isochrone if needed
-                if loc['id'] not in processed_20min:
-                    isochrone_20min = self.get_isochrone(
-                        lat=loc['latitude'],
-                        lon=loc['longitude'],
-                        range=20 * 60  # 20 minutes in seconds
-                    )
-                    
-                    result_20min = {
-                        'branch_id': loc['id'],
-                        'branch_name': loc['name'],
-                        'branch_type': loc['type'],
-                        'city': loc['city'],
-                        'isochrone_data': isochrone_20min
-                    }
-                    results_20min.append(result_20min)
-                    time.sleep(4)  # Delay after first request
+            for done, future in enumerate(as_completed(futures), start=1):
+                loc, minutes = futures[future]
+                print(f"Processed {done}/{len(tasks)}: {loc['name']} ({minutes}min)")
                 
-                # Process 10-minute isochrone if needed
-                if loc['id'] not in processed_10min:
-                    isochrone_10min = self.get_isochrone(
-                        lat=loc['latitude'],
-                        lon=loc['longitude'],
-                        range=10 * 60  # 10 minutes in seconds
-                    )
-                    
-                    result_10min = {
-                        'branch_id': loc['id'],
-                        'branch_name': loc['name'],
-                        'branch_type': loc['type'],
-                        'city': loc['city'],
-                        'isochrone_data': isochrone_10min
-                    }
-                    results_10min.append(result_10min)
-                    time.sleep(4)  # Delay after second request
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error processing {loc['name']}: {str(e)}")
+                    continue
                 
-                # Save intermediate results every 5 locations
-                if (idx + 1) % 5 == 0:
-                    if results_20min:
-                        all_results_20min = existing_20min + results_20min
-                        self._save_results(all_results_20min, output_file_20min)
-                        existing_20min = all_results_20min
-                        results_20min = []
-                    
-                    if results_10min:
-                        all_results_10min = existing_10min + results_10min
-                        self._save_results(all_results_10min, output_file_10min)
-                        existing_10min = all_results_10min
-                        results_10min = []
-                
-            except Exception as e:
-                print(f"Error processing {loc['name']}: {str(e)}")
-                continue
+                # Checkpoint each result as soon as it arrives
+                output_file = output_file_20min if minutes == 20 else output_file_10min
+                self._append_results([result], output_file)
         
-        # Save final results
-        if results_20min:
-            all_results_20min = existing_20min + results_20min
-            self._save_results(all_results_20min, output_file_20min)
+        finalize_results(output_file_20min)
+        finalize_results(output_file_10min)
+        self.save_cache()
+    
+    def save_cache(self):
+        """Persist the isochrone cache so later runs can reuse it."""
+        if not self.cache_file:
+            return
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(self._isochrone_cache, f)
+        os.replace(tmp_file, self.cache_file)
+    
+    def _process_location(self, loc: Dict, minutes: int) -> Dict:
+        """Fetch the isochrone for one location and range."""
+        isochrone = self.get_isochrone(
+            lat=loc['latitude'],
+            lon=loc['longitude'],
+            range=minutes * 60  # Minutes to seconds
+        )
         
-        if results_10min:
-            all_results_10min = existing_10min + results_10min
-            self._save_results(all_results_10min, output_file_10min)
-    
-    def _save_results(self, results: List[Dict], output_file: str):
-        """Save results to a JSON file."""
-        with open(output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        return {
+            'branch_id': loc['id'],
+            'branch_name': loc['name'],
+            'branch_type': loc['type'],
+            'city': loc['city'],
+            'isochrone_data': isochrone
+        }
+    
+    def _append_results(self, new_results: List[Dict], output_file: str):
+        """Append results to the JSON Lines checkpoint next to the output file."""
+        with open(output_file + '.jsonl', 'ab') as f:
+            for result in new_results:
+                f.write(orjson.dumps(result) + b'\n')
+
+def finalize_results(output_file: str):
+    """Merge the JSON Lines checkpoint into the output JSON file."""
+    checkpoint_file = output_file + '.jsonl'
+    if not os.path.exists(checkpoint_file):
+        return
+    
+    results = []
+    if os.path.exists(output_file):
+        with open(output_file, 'rb') as f:
+            results = orjson.loads(f.read())
+    with open(checkpoint_file, 'rb') as f:
+        results.extend(orjson.loads(line) for line in f if line.strip())
+    
+    # Write to a temporary file first so an interrupted write keeps the old results
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_file, output_file)
+    os.remove(checkpoint_file)
 
 def load_branches_data(file_path: str) -> List[Dict]:
     """Load branches data for geospatial processing."""
-    df = pd.read_csv(file_path)
-    return df.to_dict('records')
+    with open(file_path, newline='', encoding='utf-8') as f:
+        return [
+            {
+                'id': int(row['id']),
+                'name': row['name'],
+                'type': row['type'],
+                'city': row['city'],
+                'latitude': float(row['latitude']),
+                'longitude': float(row['longitude']),
+                'radius_minutes': int(row['radius_minutes'])
+            }
+            for row in csv.DictReader(f)
+        ]
+
+def _read_branch_ids(records, processed: Set[str]):
+    """Add the branch IDs of the given records to the processed set."""
+    for branch in records:
+        # Try both 'branch_id' and 'id' fields
+        branch_id = branch.get('branch_id')
+        if branch_id is None:
+            branch_id = branch.get('id')
+        if branch_id is not None:
+            processed.add(str(branch_id))
 
 def get_processed_branches(file_path: str) -> Set[str]:
     """Get set of branch IDs that have already been processed."""
     processed = set()
     if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
+        with open(file_path, 'rb') as f:
             try:
-                data = json.load(f)
-                for branch in data:
-                    # Try both 'branch_id' and 'id' fields
-                    branch_id = branch.get('branch_id')
-                    if branch_id is None:
-                        branch_id = branch.get('id')
-                    if branch_id is not None:
-                        processed.add(str(branch_id))
-                print(f"Found {len(processed)} processed branches in {file_path}")
-            except json.JSONDecodeError:
+                _read_branch_ids(orjson.loads(f.read()), processed)
+            except orjson.JSONDecodeError:
                 print(f"Warning: Could not read {file_path}. File might be empty or corrupted.")
+    
+    # Include results checkpointed by an interrupted run
+    checkpoint_file = file_path + '.jsonl'
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'rb') as f:
+            _read_branch_ids((orjson.loads(line) for line in f if line.strip()), processed)
+    
+    if processed:
+        print(f"Found {len(processed)} processed branches in {file_path}")
     return processed
 
-def process_geospatial_data(api_key: str):
+def process_geospatial_data(api_keys: List[str]):
     """Main function to process geospatial data."""
     # Create output directory if it doesn't exist
     os.makedirs('../output', exist_ok=True)
@@ -167,21 +280,29 @@ def process_geospatial_data(api_key: str):
         print("First few IDs from input data:", [str(b['id']) for b in branches_data[:5]])
     
     # Filter branches that need processing (missing from either file)
-    branches_to_process = [
-        branch for branch in branches_data 
-        if str(branch['id']) not in processed_20min or str(branch['id']) not in processed_10min
-    ]
+    branches_to_process = []
+    missing_20min = missing_10min = 0
+    for branch in branches_data:
+        branch_id = str(branch['id'])
+        in_20min = branch_id in processed_20min
+        in_10min = branch_id in processed_10min
+        if not (in_20min and in_10min):
+            branches_to_process.append(branch)
+            missing_20min += not in_20min
+            missing_10min += not in_10min
     
     if not branches_to_process:
+        finalize_results(output_file_20min)
+        finalize_results(output_file_10min)
         print("All branches have been processed in both 10min and 20min files!")
         return
     
     print(f"Found {len(branches_to_process)} branches that need processing:")
-    print(f"- Missing from 20min file: {len([b for b in branches_to_process if str(b['id']) not in processed_20min])}")
-    print(f"- Missing from 10min file: {len([b for b in branches_to_process if str(b['id']) not in processed_10min])}")
+    print(f"- Missing from 20min file: {missing_20min}")
+    print(f"- Missing from 10min file: {missing_10min}")
     
     # Initialize OpenRouteService client
-    ors = OpenRouteService(api_key)
+    ors = OpenRouteService(api_keys, cache_file='../output/isochrone_cache.pkl')
     
     # Process locations
     ors.batch_process_locations(
@@ -197,7 +318,9 @@ def process_geospatial_data(api_key: str):
     print(f"10-minute results saved to {output_file_10min}")
 
 if __name__ == "__main__":
-    # You'll need to replace this with your actual OpenRouteService API key
-    API_KEY = "5b3ce3597851110001cf62487c99fe6a43ed4e76ab7ff6715ade0102"
-    JOEL_API_KEY = "5b3ce3597851110001cf62487d3994c67c8e495d939a9b1f2fa9a0dc"
-    process_geospatial_data(JOEL_API_KEY)
\ No newline at end of file
+    # Comma-separated OpenRouteService API keys, e.g. ORS_API_KEYS="key1,key2"
+    API_KEYS = [key.strip() for key in os.environ.get('ORS_API_KEYS', '').split(',') if key.strip()]
+    if not API_KEYS:
+        sys.exit("No OpenRouteService API keys configured. Set ORS_API_KEYS to a "
+                 "comma-separated list of keys, e.g. ORS_API_KEYS=\"key1,key2\".")
+    process_geospatial_data(API_KEYS)
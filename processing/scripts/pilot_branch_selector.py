@@ -1,17 +1,16 @@
 import pandas as pd
 import numpy as np
-from collections import Counter
-from typing import List, Dict, Tuple
-import folium
-from folium.plugins import HeatMap
-import branca.colormap as cm
-from geopy.distance import geodesic
-import random
+from collections import Counter, OrderedDict
+from typing import List, Optional, Tuple
 from dataclasses import dataclass
 import os
-import json
+import orjson
 
-@dataclass
+EARTH_RADIUS_KM = 6371.0
+# Maximum number of combinations kept in the GA fitness cache
+FITNESS_CACHE_SIZE = 10000
+
+@dataclass(slots=True)
 class Branch:
     branch_id: int
     branch_name: str
@@ -23,11 +22,13 @@ class Branch:
     outer_population: float
     income_per_capita: float
     total_score: float
+    region: Optional[str] = None
 
 class PilotBranchSelector:
-    def __init__(self, num_branches: int, min_distance_km: float = 5.0):
+    def __init__(self, num_branches: int, min_distance_km: float = 5.0, seed: Optional[int] = None):
         self.num_branches = num_branches
         self.min_distance_km = min_distance_km
+        self.rng = np.random.default_rng(seed)
         self.regions = {
             'north': {'lat': (47.5, 48.0), 'lon': (8.0, 9.0)},
             'east': {'lat': (47.0, 47.5), 'lon': (9.0, 10.0)},
@@ -35,53 +36,71 @@ class PilotBranchSelector:
             'west': {'lat': (47.0, 47.5), 'lon': (7.0, 8.0)},
             'central': {'lat': (46.5, 47.0), 'lon': (7.0, 8.0)}
         }
+        # Fitness by set of branch indices, least recently used first; the fitness
+        # does not depend on branch order
+        self._fitness_cache: OrderedDict[frozenset, float] = OrderedDict()
     
     def load_data(self) -> List[Branch]:
         """Load and prepare branch data."""
         # Load scoring data
-        scores_df = pd.read_csv('../output/location_scores.csv')
+        scores_df = pd.read_parquet(
+            '../output/location_scores.parquet',
+            columns=['branch_id', 'branch_name', 'branch_type', 'city', 'inner_population',
+                     'outer_population', 'income_per_capita', 'total_score']
+        )
         
         # Load geospatial data
-        geo_df = pd.read_csv('../output/geospatial_branches_data.csv')
+        geo_df = pd.read_parquet(
+            '../output/geospatial_branches_data.parquet',
+            columns=['id', 'latitude', 'longitude']
+        )
         
         # Merge data
         merged_df = pd.merge(
             scores_df,
-            geo_df[['id', 'latitude', 'longitude']],
+            geo_df,
             left_on='branch_id',
             right_on='id',
             how='left'
         )
         
+        merged_df = merged_df.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+        
+        # Column arrays for the vectorized fitness calculations, indexed like the branches
+        self.latitude = merged_df['latitude'].to_numpy(np.float64)
+        self.longitude = merged_df['longitude'].to_numpy(np.float64)
+        self.inner_population = merged_df['inner_population'].to_numpy(np.float64)
+        self.outer_population = merged_df['outer_population'].to_numpy(np.float64)
+        self.income = merged_df['income_per_capita'].to_numpy(np.float64)
+        self.score = merged_df['total_score'].to_numpy(np.float64)
+        
+        # Pairs of branches closer than the minimum distance, computed once with the
+        # equirectangular approximation (well under 1% error at these distances)
+        lat_rad = np.deg2rad(self.latitude)
+        lon_rad = np.deg2rad(self.longitude)
+        dx = (lon_rad[:, None] - lon_rad[None, :]) * np.cos((lat_rad[:, None] + lat_rad[None, :]) / 2)
+        dy = lat_rad[:, None] - lat_rad[None, :]
+        self.too_close = EARTH_RADIUS_KM * np.hypot(dx, dy) < self.min_distance_km
+        np.fill_diagonal(self.too_close, False)
+        
         # Convert to Branch objects
-        branches = []
-        for _, row in merged_df.iterrows():
-            if pd.isna(row['latitude']) or pd.isna(row['longitude']):
-                continue
-                
-            branch = Branch(
-                branch_id=row['branch_id'],
-                branch_name=row['branch_name'],
-                branch_type=row['branch_type'],
-                city=row['city'],
-                latitude=row['latitude'],
-                longitude=row['longitude'],
-                inner_population=row['inner_population'],
-                outer_population=row['outer_population'],
-                income_per_capita=row['income_per_capita'],
-                total_score=row['total_score']
-            )
-            branches.append(branch)
+        columns = ['branch_id', 'branch_name', 'branch_type', 'city', 'latitude', 'longitude',
+                   'inner_population', 'outer_population', 'income_per_capita', 'total_score']
+        branches = [Branch(*values) for values in zip(*(merged_df[c].tolist() for c in columns))]
+        for branch in branches:
+            branch.region = self.get_region(branch)
+        
+        self.branches = branches
+        self.branch_index = {b.branch_id: i for i, b in enumerate(branches)}
+        
+        # Integer codes for counting branch types and regions per individual
+        self.type_codes, type_names = pd.factorize(merged_df['branch_type'], use_na_sentinel=False)
+        self.num_types = len(type_names)
+        region_names = list(self.regions) + ['other']
+        self.region_codes = np.array([region_names.index(b.region) for b in branches], dtype=np.int64)
             
         return branches
     
-    def calculate_distance(self, branch1: Branch, branch2: Branch) -> float:
-        """Calculate distance between two branches in kilometers."""
-        return geodesic(
-            (branch1.latitude, branch1.longitude),
-            (branch2.latitude, branch2.longitude)
-        ).kilometers
-    
     def get_region(self, branch: Branch) -> str:
         """Determine the region of a branch based on coordinates."""
         for region, bounds in self.regions.items():
@@ -90,127 +109,162 @@ class PilotBranchSelector:
                 return region
         return 'other'
     
+    def branch_indices(self, selected_branches: List[Branch]) -> np.ndarray:
+        """Positions of the selected branches in the loaded column arrays."""
+        return np.fromiter((self.branch_index[b.branch_id] for b in selected_branches),
+                           dtype=np.int64, count=len(selected_branches))
+    
     def is_valid_combination(self, selected_branches: List[Branch]) -> bool:
         """Check if the combination of branches satisfies the minimum distance constraint."""
-        for i, branch1 in enumerate(selected_branches):
-            for branch2 in selected_branches[i+1:]:
-                if self.calculate_distance(branch1, branch2) < self.min_distance_km:
-                    return False
-        return True
+        return self.is_valid_indices(self.branch_indices(selected_branches))
+    
+    def is_valid_indices(self, idx: np.ndarray) -> bool:
+        """Minimum distance check for a combination given as branch indices."""
+        return not self.too_close[idx[:, None], idx].any()
     
     def calculate_coverage_score(self, selected_branches: List[Branch]) -> float:
         """Calculate population coverage score."""
-        total_population = 0
-        
-        # Calculate population coverage
-        for branch in selected_branches:
-            total_population += branch.inner_population
-            # Add outer population with distance-based weighting
-            total_population += branch.outer_population * 0.5
-        
-        return total_population
+        return float(self.coverage_scores(self.branch_indices(selected_branches)[None, :])[0])
     
     def calculate_diversity_score(self, selected_branches: List[Branch]) -> float:
         """Calculate diversity score based on branch types and regions."""
+        return float(self.diversity_scores(self.branch_indices(selected_branches)[None, :])[0])
+    
+    def calculate_performance_score(self, selected_branches: List[Branch]) -> float:
+        """Calculate average performance score of selected branches."""
+        return float(self.score[self.branch_indices(selected_branches)].mean())
+    
+    def evaluate_fitness(self, selected_branches: List[Branch]) -> float:
+        """Evaluate the fitness of a combination of branches."""
+        return float(self.evaluate_fitness_batch(self.branch_indices(selected_branches)[None, :])[0])
+    
+    def valid_rows(self, idx: np.ndarray) -> np.ndarray:
+        """Minimum distance check for each row of a (pop_size, num_branches) index matrix."""
+        return ~self.too_close[idx[:, :, None], idx[:, None, :]].any(axis=(1, 2))
+    
+    def coverage_scores(self, idx: np.ndarray) -> np.ndarray:
+        """Population coverage of each row of a (pop_size, num_branches) index matrix."""
+        # Outer population is weighted by half for being further away
+        return (self.inner_population[idx] + self.outer_population[idx] * 0.5).sum(axis=1)
+    
+    def diversity_scores(self, idx: np.ndarray) -> np.ndarray:
+        """Branch type, region and income diversity of each row of a (pop_size, num_branches) index matrix."""
+        size = idx.shape[1]
+        
         # Branch type diversity
-        type_counts = Counter(b.branch_type for b in selected_branches)
-        type_diversity = 1 - (max(type_counts.values()) / len(selected_branches))
+        type_counts = (self.type_codes[idx][:, :, None] == np.arange(self.num_types)).sum(axis=1)
+        type_diversity = 1 - type_counts.max(axis=1) / size
         
         # Geographic spread
-        regions = set(self.get_region(b) for b in selected_branches)
-        region_diversity = len(regions) / len(self.regions)
+        region_present = self.region_codes[idx][:, :, None] == np.arange(len(self.regions) + 1)
+        region_diversity = region_present.any(axis=1).sum(axis=1) / len(self.regions)
         
         # Income level diversity
-        income_levels = [b.income_per_capita for b in selected_branches]
-        income_diversity = 1 - (np.std(income_levels) / np.mean(income_levels))
+        income_levels = self.income[idx]
+        income_diversity = 1 - income_levels.std(axis=1) / income_levels.mean(axis=1)
         
         return (type_diversity + region_diversity + income_diversity) / 3
     
-    def calculate_performance_score(self, selected_branches: List[Branch]) -> float:
-        """Calculate average performance score of selected branches."""
-        return np.mean([b.total_score for b in selected_branches])
-    
-    def evaluate_fitness(self, selected_branches: List[Branch]) -> float:
-        """Evaluate the fitness of a combination of branches."""
-        if not self.is_valid_combination(selected_branches):
-            return float('-inf')  # Invalid combination gets lowest possible score
-            
-        coverage_score = self.calculate_coverage_score(selected_branches)
-        diversity_score = self.calculate_diversity_score(selected_branches)
-        performance_score = self.calculate_performance_score(selected_branches)
+    def evaluate_fitness_batch(self, idx: np.ndarray) -> np.ndarray:
+        """Evaluate the fitness of each row of a (pop_size, num_branches) index matrix."""
+        coverage_score = self.coverage_scores(idx)
+        diversity_score = self.diversity_scores(idx)
+        performance_score = self.score[idx].mean(axis=1)
         
-        return (0.4 * coverage_score + 
-                0.3 * diversity_score + 
-                0.3 * performance_score)
+        fitness = (0.4 * coverage_score +
+                   0.3 * diversity_score +
+                   0.3 * performance_score)
+        # Invalid combinations get the lowest possible score
+        return np.where(self.valid_rows(idx), fitness, float('-inf'))
+    
+    def sample_individual(self, available: np.ndarray) -> Optional[np.ndarray]:
+        """Draw branches one at a time, each outside the minimum distance of those already drawn."""
+        available = available.copy()
+        individual = []
+        for _ in range(self.num_branches):
+            candidates = np.flatnonzero(available)
+            if len(candidates) == 0:
+                return None
+            pick = candidates[self.rng.integers(len(candidates))]
+            individual.append(pick)
+            # Exclude the pick and every branch too close to it
+            available &= ~self.too_close[pick]
+            available[pick] = False
+        return np.array(individual)
     
-    def initialize_population(self, all_branches: List[Branch], 
-                            population_size: int) -> List[List[Branch]]:
-        """Initialize population for genetic algorithm."""
+    def initialize_population(self, pool_mask: np.ndarray, population_size: int) -> np.ndarray:
+        """Initialize population for genetic algorithm as rows of branch indices."""
         population = []
         attempts = 0
         max_attempts = population_size * 10  # Limit attempts to avoid infinite loop
         
         while len(population) < population_size and attempts < max_attempts:
-            individual = random.sample(all_branches, self.num_branches)
-            if self.is_valid_combination(individual):
+            individual = self.sample_individual(pool_mask)
+            if individual is not None:
                 population.append(individual)
             attempts += 1
             
         if len(population) < population_size:
             raise ValueError(f"Could not generate enough valid combinations. Only found {len(population)} valid combinations after {max_attempts} attempts.")
             
-        return population
+        return np.array(population)
     
-    def select_parents(self, population: List[List[Branch]], 
-                      fitness_scores: List[float]) -> List[List[Branch]]:
+    def select_parents(self, population: np.ndarray, fitness_scores: List[float]) -> np.ndarray:
         """Select parents for next generation using tournament selection."""
-        parents = []
-        for _ in range(len(population)):
-            # Tournament selection
-            tournament = random.sample(list(zip(population, fitness_scores)), 3)
-            winner = max(tournament, key=lambda x: x[1])[0]
-            parents.append(winner)
-        return parents
+        fitness = np.asarray(fitness_scores)
+        pop_size = len(population)
+        
+        # Draw all tournaments of 3 at once and keep the fittest of each
+        tournaments = self.rng.integers(0, pop_size, size=(pop_size, 3))
+        winners = tournaments[np.arange(pop_size), fitness[tournaments].argmax(axis=1)]
+        return population[winners]
     
-    def crossover(self, parent1: List[Branch], parent2: List[Branch]) -> Tuple[List[Branch], List[Branch]]:
+    def crossover(self, parent1: np.ndarray, parent2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """Perform crossover between two parents."""
         # Single point crossover
-        point = random.randint(1, self.num_branches - 1)
-        child1 = parent1[:point] + [b for b in parent2 if b not in parent1[:point]]
-        child2 = parent2[:point] + [b for b in parent1 if b not in parent2[:point]]
+        point = self.rng.integers(1, self.num_branches)
+        prefix1 = set(parent1[:point].tolist())
+        prefix2 = set(parent2[:point].tolist())
+        child1 = np.array(parent1[:point].tolist() + [b for b in parent2.tolist() if b not in prefix1])
+        child2 = np.array(parent2[:point].tolist() + [b for b in parent1.tolist() if b not in prefix2])
         
         # Ensure children maintain minimum distance
-        if not self.is_valid_combination(child1):
+        if not self.is_valid_indices(child1):
             child1 = parent1
-        if not self.is_valid_combination(child2):
+        if not self.is_valid_indices(child2):
             child2 = parent2
             
         return child1[:self.num_branches], child2[:self.num_branches]
     
-    def mutate(self, individual: List[Branch], all_branches: List[Branch]) -> List[Branch]:
-        """Mutate an individual by replacing a random branch."""
-        if random.random() < 0.1:  # 10% mutation rate
-            idx = random.randint(0, len(individual) - 1)
-            # Try to find a valid replacement
-            attempts = 0
-            max_attempts = 50
-            while attempts < max_attempts:
-                new_branch = random.choice([b for b in all_branches if b not in individual])
-                test_individual = individual.copy()
-                test_individual[idx] = new_branch
-                if self.is_valid_combination(test_individual):
-                    return test_individual
-                attempts += 1
-        return individual
+    def mutate(self, individual: np.ndarray, pool_mask: np.ndarray, idx: int) -> np.ndarray:
+        """Mutate an individual by replacing the branch at position idx."""
+        # Replacements must keep the minimum distance to all other selected branches
+        others = np.delete(individual, idx)
+        available = pool_mask & ~self.too_close[others].any(axis=0)
+        available[individual] = False
+        
+        candidates = np.flatnonzero(available)
+        if len(candidates) == 0:
+            return individual
+        
+        mutated = individual.copy()
+        mutated[idx] = candidates[self.rng.integers(len(candidates))]
+        return mutated
     
     def find_optimal_combination(self, all_branches: List[Branch]) -> List[Branch]:
         """Find the optimal combination of branches using genetic algorithm."""
         population_size = 100
         generations = 50
         
+        self._fitness_cache.clear()
+        
+        # Individuals are arrays of indices into the loaded branch arrays
+        pool_mask = np.zeros(len(self.branches), dtype=bool)
+        pool_mask[self.branch_indices(all_branches)] = True
+        
         # Initialize population
         try:
-            population = self.initialize_population(all_branches, population_size)
+            population = self.initialize_population(pool_mask, population_size)
         except ValueError as e:
             print(f"Error: {e}")
             print("Try reducing the number of branches or increasing the minimum distance.")
@@ -220,9 +274,19 @@ class PilotBranchSelector:
         best_fitness = float('-inf')
         
         for generation in range(generations):
-            # Evaluate fitness
-            fitness_scores = [self.evaluate_fitness(individual) 
-                            for individual in population]
+            # Evaluate fitness, scoring only combinations not seen before in one batch
+            keys = [frozenset(individual.tolist()) for individual in population]
+            new = [i for i, key in enumerate(keys) if key not in self._fitness_cache]
+            if new:
+                new_scores = self.evaluate_fitness_batch(population[new])
+                self._fitness_cache.update(zip((keys[i] for i in new), new_scores.tolist()))
+            fitness_scores = [self._fitness_cache[key] for key in keys]
+            
+            # Keep the current generation as most recently used and drop the oldest entries
+            for key in keys:
+                self._fitness_cache.move_to_end(key)
+            while len(self._fitness_cache) > FITNESS_CACHE_SIZE:
+                self._fitness_cache.popitem(last=False)
             
             # Update best solution
             max_fitness_idx = np.argmax(fitness_scores)
@@ -237,21 +301,30 @@ class PilotBranchSelector:
             new_population = []
             for i in range(0, len(parents), 2):
                 child1, child2 = self.crossover(parents[i], parents[i+1])
-                new_population.extend([
-                    self.mutate(child1, all_branches),
-                    self.mutate(child2, all_branches)
-                ])
+                new_population.extend([child1, child2])
+            
+            # Mutate 10% of the children at a random position
+            mutate_mask = self.rng.random(len(new_population)) < 0.1
+            positions = self.rng.integers(0, self.num_branches, size=len(new_population))
+            for i in np.flatnonzero(mutate_mask):
+                new_population[i] = self.mutate(new_population[i], pool_mask, positions[i])
             
-            population = new_population
+            population = np.array(new_population)
         
-        return best_solution if best_solution else []
+        if best_solution is None:
+            return []
+        return [self.branches[i] for i in best_solution]
     
     def visualize_selection(self, selected_branches: List[Branch], output_dir: str):
         """Create visualizations for the selected branches."""
+        # Only needed for rendering, so importing the selector stays lightweight
+        import folium
+        
         # Create base map
         m = folium.Map(location=[46.8182, 8.2275], zoom_start=8)
         
-        # Add selected branches
+        # Add selected branches as one GeoJSON layer instead of one marker per branch
+        features = []
         for branch in selected_branches:
             popup_text = f"""
             <b>{branch.branch_name}</b><br>
@@ -261,25 +334,26 @@ class PilotBranchSelector:
             Population (20min): {branch.outer_population:.0f}<br>
             Income: {branch.income_per_capita:.0f} CHF
             """
-            
-            folium.CircleMarker(
-                location=[branch.latitude, branch.longitude],
-                radius=8,
-                popup=folium.Popup(popup_text, max_width=300),
-                color='red',
-                fill=True,
-                fill_opacity=0.7
-            ).add_to(m)
-            
-            # Add minimum distance circle
-            folium.Circle(
-                location=[branch.latitude, branch.longitude],
-                radius=self.min_distance_km * 1000,  # Convert to meters
-                color='gray',
-                fill=False,
-                weight=1,
-                dash_array='5, 5'
-            ).add_to(m)
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [branch.longitude, branch.latitude]},
+                'properties': {'popup': popup_text}
+            })
+        branches_geojson = {'type': 'FeatureCollection', 'features': features}
+        
+        folium.GeoJson(
+            branches_geojson,
+            marker=folium.CircleMarker(radius=8, fill=True),
+            style_function=lambda feature: {'color': 'red', 'fillColor': 'red', 'fillOpacity': 0.7},
+            popup=folium.GeoJsonPopup(fields=['popup'], labels=False, max_width=300)
+        ).add_to(m)
+        
+        # Add minimum distance circles
+        folium.GeoJson(
+            branches_geojson,
+            marker=folium.Circle(radius=self.min_distance_km * 1000),  # Convert to meters
+            style_function=lambda feature: {'color': 'gray', 'fill': False, 'weight': 1, 'dashArray': '5, 5'}
+        ).add_to(m)
         
         # Save the map
         m.save(os.path.join(output_dir, 'pilot_branches.html'))
@@ -289,7 +363,7 @@ class PilotBranchSelector:
             'Total Population Reached': sum(b.inner_population for b in selected_branches),
             'Average Score': np.mean([b.total_score for b in selected_branches]),
             'Branch Types': Counter(b.branch_type for b in selected_branches),
-            'Regions': Counter(self.get_region(b) for b in selected_branches),
+            'Regions': Counter(b.region for b in selected_branches),
             'Average Income': np.mean([b.income_per_capita for b in selected_branches])
         }
         
@@ -321,8 +395,12 @@ def main():
     
     # Save selected branch IDs
     selected_ids = [b.branch_id for b in selected_branches]
-    with open(os.path.join(output_dir, 'selected_branches.json'), 'w') as f:
-        json.dump(selected_ids, f)
+    # Write to a temporary file first so an interrupted write keeps the old selection
+    output_file = os.path.join(output_dir, 'selected_branches.json')
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(orjson.dumps(selected_ids))
+    os.replace(tmp_file, output_file)
     
     # Print summary
     print("\nSelected Branches:")
@@ -1,17 +1,22 @@
 import pandas as pd
-import numpy as np
+import pyarrow.csv as pv
+import pyarrow.compute as pc
 import os
 
 def load_income_data(file_path: str) -> pd.DataFrame:
     """Load and process the income data CSV file."""
-    # Read the CSV with semicolon separator
-    df = pd.read_csv(file_path, sep=';')
+    # Read only the needed columns of the semicolon separated CSV
+    table = pv.read_csv(
+        file_path,
+        parse_options=pv.ParseOptions(delimiter=';'),
+        convert_options=pv.ConvertOptions(include_columns=['GEO_ID', 'GEO_NAME', 'VARIABLE', 'VALUE'])
+    )
     
     # Filter for per capita income data
-    df = df[df['VARIABLE'] == 'Steuerbares Einkommen pro Einwohner/-in, in Franken']
+    table = table.filter(pc.equal(table['VARIABLE'], 'Steuerbares Einkommen pro Einwohner/-in, in Franken'))
     
     # Select and rename relevant columns
-    df = df[['GEO_ID', 'GEO_NAME', 'VALUE']]
+    df = table.select(['GEO_ID', 'GEO_NAME', 'VALUE']).to_pandas()
     df = df.rename(columns={
         'GEO_ID': 'municipality_id',
         'GEO_NAME': 'municipality',
@@ -32,12 +37,12 @@ def analyze_income_data(df: pd.DataFrame):
     print(f"Maximum income per capita: {df['income_per_capita'].max():.2f} CHF")
     
     print("\n=== Top 10 Municipalities by Income ===")
-    top_10 = df.nlargest(10, 'income_per_capita')
-    print(top_10[['municipality', 'income_per_capita']].to_string(index=False))
+    top_10 = df.loc[df['income_per_capita'].nlargest(10).index, ['municipality', 'income_per_capita']]
+    print(top_10.to_string(index=False))
     
     print("\n=== Bottom 10 Municipalities by Income ===")
-    bottom_10 = df.nsmallest(10, 'income_per_capita')
-    print(bottom_10[['municipality', 'income_per_capita']].to_string(index=False))
+    bottom_10 = df.loc[df['income_per_capita'].nsmallest(10).index, ['municipality', 'income_per_capita']]
+    print(bottom_10.to_string(index=False))
 
 def main():
     # Create output directory if it doesn't exist
@@ -50,8 +55,8 @@ def main():
     analyze_income_data(income_df)
     
     # Save processed data
-    output_path = '../output/processed_income_data.csv'
-    income_df.to_csv(output_path, index=False)
+    output_path = '../output/processed_income_data.parquet'
+    income_df.to_parquet(output_path, compression='zstd', index=False)
     print(f"\nProcessed income data saved to {output_path}")
 
 if __name__ == "__main__":
@@ -1,10 +1,11 @@
-import json
+import ijson
 import pandas as pd
-from typing import Dict, List
+from itertools import islice
+from typing import Dict, Iterable, Iterator
 import os
 
 # Type mapping for allowed branch types
-ALLOWED_TYPES = ['m', 'mm', 'mmm', 'voi']
+ALLOWED_TYPES = frozenset({'m', 'mm', 'mmm', 'voi'})
 
 TYPE_MAP = {
     'm': {
@@ -25,36 +26,70 @@ TYPE_MAP = {
     }
 }
 
-def load_migros_data(file_path: str) -> List[Dict]:
-    """Load and parse the Migros filial data from JSON file."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return data['data']['facilities']['results']
+# Low-cardinality string columns stored as categoricals
+CATEGORICAL_COLUMNS = ['type', 'type_name', 'type_description', 'city', 'country']
 
-def filter_branches(facilities: List[Dict]) -> List[Dict]:
+# Facility fields kept from the JSON records, flattened by json_normalize
+# (same loader as preprocessing/process_migros_data.py, keep both in sync)
+FACILITY_FIELDS = [
+    'id', 'name', 'type', 'location.address', 'location.zip', 'location.city',
+    'location.country', 'location.geo.lat', 'location.geo.lon'
+]
+# Number of facility records flattened at a time
+FACILITY_CHUNK_SIZE = 1000
+
+def load_migros_data(file_path: str) -> Iterator[Dict]:
+    """Stream the Migros filial data from JSON file one facility at a time."""
+    with open(file_path, 'rb') as f:
+        yield from ijson.items(f, 'data.facilities.results.item', use_float=True)
+
+def filter_branches(facilities: Iterable[Dict]) -> Iterator[Dict]:
     """Filter branches to only include allowed types."""
-    return [f for f in facilities if f['type'] in ALLOWED_TYPES]
+    return (f for f in facilities if f['type'] in ALLOWED_TYPES)
+
+def normalize_facilities(facilities: Iterable[Dict]) -> pd.DataFrame:
+    """Flatten the facility records in chunks so only one chunk of dicts is held at a time."""
+    facilities = iter(facilities)
+    chunks = []
+    while True:
+        chunk = list(islice(facilities, FACILITY_CHUNK_SIZE))
+        if not chunk:
+            break
+        chunks.append(pd.json_normalize(chunk).reindex(columns=FACILITY_FIELDS))
+    if not chunks:
+        return pd.DataFrame(columns=FACILITY_FIELDS)
+    return pd.concat(chunks, ignore_index=True)
 
-def create_branches_dataframe(facilities: List[Dict]) -> pd.DataFrame:
+def create_branches_dataframe(facilities: Iterable[Dict]) -> pd.DataFrame:
     """Create a pandas DataFrame from the filtered facilities data."""
-    rows = []
-    for facility in facilities:
-        row = {
-            'id': facility['id'],
-            'name': facility['name'],
-            'type': facility['type'],
-            'type_name': TYPE_MAP.get(facility['type'], {}).get('name', 'Unknown'),
-            'type_description': TYPE_MAP.get(facility['type'], {}).get('description', 'Unknown'),
-            'address': facility['location']['address'],
-            'zip_code': facility['location']['zip'],
-            'city': facility['location']['city'],
-            'country': facility['location']['country'],
-            'latitude': facility['location']['geo']['lat'],
-            'longitude': facility['location']['geo']['lon']
-        }
-        rows.append(row)
+    df = normalize_facilities(facilities)
+    df = df.rename(columns={
+        'location.address': 'address',
+        'location.zip': 'zip_code',
+        'location.city': 'city',
+        'location.country': 'country',
+        'location.geo.lat': 'latitude',
+        'location.geo.lon': 'longitude'
+    })
+    
+    # Look up type name and description for all rows at once
+    type_df = pd.DataFrame.from_dict(TYPE_MAP, orient='index').rename(columns={
+        'name': 'type_name',
+        'description': 'type_description'
+    })
+    df = df.join(type_df, on='type')
+    df[['type_name', 'type_description']] = df[['type_name', 'type_description']].fillna('Unknown')
+    
+    df = df[[
+        'id', 'name', 'type', 'type_name', 'type_description', 'address',
+        'zip_code', 'city', 'country', 'latitude', 'longitude'
+    ]]
+    
+    # Store repeated string columns as categoricals
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
     
-    return pd.DataFrame(rows)
+    return df
 
 def analyze_branches(df: pd.DataFrame):
     """Perform basic analysis on the Migros branches data."""
@@ -82,8 +117,8 @@ def main():
     analyze_branches(df)
     
     # Save processed data
-    output_path = '../output/processed_migros_branches.csv'
-    df.to_csv(output_path, index=False)
+    output_path = '../output/processed_migros_branches.parquet'
+    df.to_parquet(output_path, compression='zstd', index=False)
     print(f"\nProcessed data saved to {output_path}")
 
 if __name__ == "__main__":
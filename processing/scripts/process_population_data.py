@@ -1,14 +1,18 @@
 import pandas as pd
-import numpy as np
+import pyarrow.csv as pv
 import os
 
 def load_population_data(file_path: str) -> pd.DataFrame:
     """Load and process the population data CSV file."""
-    # Read the CSV with semicolon separator
-    df = pd.read_csv(file_path, sep=';')
-    
-    # Select and rename relevant columns
-    df = df[['ERHJAHR', 'GDENR', 'GDEHISTID', 'GTOT']]
+    # Read only the needed columns of the semicolon separated CSV
+    table = pv.read_csv(
+        file_path,
+        parse_options=pv.ParseOptions(delimiter=';'),
+        convert_options=pv.ConvertOptions(include_columns=['ERHJAHR', 'GDENR', 'GDEHISTID', 'GTOT'])
+    )
+    
+    # Rename relevant columns
+    df = table.to_pandas()
     df = df.rename(columns={
         'ERHJAHR': 'year',
         'GDENR': 'municipality_id',
@@ -31,11 +35,11 @@ def analyze_population_data(df: pd.DataFrame):
     print(f"Maximum population: {df['total_population'].max()}")
     
     print("\n=== Top 10 Municipalities by Population ===")
-    top_10 = df.nlargest(10, 'total_population')
+    top_10 = df.loc[df['total_population'].nlargest(10).index]
     print(top_10.to_string(index=False))
     
     print("\n=== Bottom 10 Municipalities by Population ===")
-    bottom_10 = df.nsmallest(10, 'total_population')
+    bottom_10 = df.loc[df['total_population'].nsmallest(10).index]
     print(bottom_10.to_string(index=False))
 
 def main():
@@ -49,8 +53,8 @@ def main():
     analyze_population_data(pop_df)
     
     # Save processed data
-    output_path = '../output/processed_population_data.csv'
-    pop_df.to_csv(output_path, index=False)
+    output_path = '../output/processed_population_data.parquet'
+    pop_df.to_parquet(output_path, compression='zstd', index=False)
     print(f"\nProcessed population data saved to {output_path}")
 
 if __name__ == "__main__":
@@ -1,12 +1,23 @@
 import pandas as pd
 import numpy as np
-import json
+import pyarrow as pa
+import pyarrow.csv as pv
+import ijson
 import os
-from typing import Dict, List, Tuple
-from dataclasses import dataclass
+import re
+from typing import Dict, Iterator, Optional
+from dataclasses import dataclass, fields
 from pathlib import Path
 
-@dataclass
+# Branch type keywords of special locations (e.g., train stations, airports)
+SPECIAL_LOCATION_PATTERN = re.compile(r'BAHN|SBB|AIRPORT|FLUGHAFEN')
+
+# Stand-in for the properties of a malformed isochrone, scored as missing metrics
+MISSING_PROPERTIES = {'total_pop': None, 'area': None, 'reachfactor': None}
+# Branch fields every 20min record must carry to be scored
+IDENTITY_FIELDS = ('branch_name', 'branch_type', 'city')
+
+@dataclass(slots=True)
 class LocationScore:
     branch_id: str
     branch_name: str
@@ -28,7 +39,8 @@ class LocationScorer:
         self.isochrone_10min_path = isochrone_10min_path
         self.isochrone_20min_path = isochrone_20min_path
         self.income_data_path = income_data_path
-        self.scores: List[LocationScore] = []
+        # Scores with one column per LocationScore field and one row per branch
+        self.scores = pd.DataFrame(columns=[field.name for field in fields(LocationScore)])
         
         # Constants for scoring
         self.INNER_RADIUS_MINUTES = 10
@@ -64,42 +76,39 @@ class LocationScorer:
         base_score = self.BRANCH_TYPE_SCORES.get(branch_type, 0.4)  # Default to 0.3 for unknown types
         
         # Additional bonus for special locations (e.g., train stations, airports)
-        if any(keyword in branch_type.upper() for keyword in ['BAHN', 'SBB', 'AIRPORT', 'FLUGHAFEN']):
+        if SPECIAL_LOCATION_PATTERN.search(branch_type):
             base_score = min(base_score + 0.1, 1.0)
         
         return base_score
     
-    def load_income_data(self) -> Dict[str, float]:
-        """Load income data and create a municipality to income mapping."""
-        df = pd.read_csv(self.income_data_path)
-        # Create a mapping of municipality name to income
-        return dict(zip(df['municipality'], df['income_per_capita']))
+    def load_income_data(self) -> pd.Series:
+        """Load income data as a Series of income indexed by municipality."""
+        df = pd.read_parquet(self.income_data_path, columns=['municipality', 'income_per_capita'])
+        # Keep one income per municipality name so the Series can be reindexed
+        df = df.drop_duplicates('municipality', keep='last')
+        return pd.Series(df['income_per_capita'].to_numpy(), index=df['municipality'].to_numpy())
     
-    def calculate_income_score(self, income: float) -> float:
-        """Calculate normalized income score."""
-        if pd.isna(income) or income < self.MIN_INCOME:
-            return 0.0
+    def calculate_income_score(self, income: np.ndarray) -> np.ndarray:
+        """Calculate normalized income scores (element-wise)."""
+        income = np.asarray(income, dtype=np.float64)
         # Normalize income between MIN_INCOME and MAX_INCOME
-        normalized = min(max((income - self.MIN_INCOME) / (self.MAX_INCOME - self.MIN_INCOME), 0), 1)
-        return normalized
+        normalized = np.clip((income - self.MIN_INCOME) / (self.MAX_INCOME - self.MIN_INCOME), 0, 1)
+        return np.where(np.isnan(income) | (income < self.MIN_INCOME), 0.0, normalized)
     
-    def calculate_population_income_score(self, inner_pop: float, outer_pop: float, 
-                                        area: float, income: float) -> float:
-        """Calculate a combined score based on population density and income."""
-        # Calculate population density (people per km²)
-        total_pop = inner_pop + outer_pop
-        if area <= 0:
-            return 0.0
+    def calculate_population_income_score(self, inner_pop: np.ndarray, outer_pop: np.ndarray,
+                                        area: np.ndarray, income: np.ndarray) -> np.ndarray:
+        """Calculate combined scores based on population density and income (element-wise)."""
+        area = np.asarray(area, dtype=np.float64)
         
-        pop_density = total_pop / (area / 1000000)  # Convert area from m² to km²
+        # Calculate population density (people per km²), undefined where there is no area
+        total_pop = np.asarray(inner_pop, dtype=np.float64) + outer_pop
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pop_density = total_pop / (area / 1000000)  # Convert area from m² to km²
         
-        # Normalize population density
-        if pop_density < self.MIN_POP_DENSITY:
-            density_score = 0.0
-        elif pop_density > self.MAX_POP_DENSITY:
-            density_score = 1.0
-        else:
-            density_score = (pop_density - self.MIN_POP_DENSITY) / (self.MAX_POP_DENSITY - self.MIN_POP_DENSITY)
+        # Normalize population density between MIN_POP_DENSITY and MAX_POP_DENSITY
+        density_score = np.clip(
+            (pop_density - self.MIN_POP_DENSITY) / (self.MAX_POP_DENSITY - self.MIN_POP_DENSITY), 0, 1
+        )
         
         # Calculate income score
         income_score = self.calculate_income_score(income)
@@ -108,138 +117,157 @@ class LocationScorer:
         # This means both high population density AND high income are needed for a good score
         combined_score = np.sqrt(density_score * income_score)
         
-        return combined_score
+        return np.where(area > 0, combined_score, 0.0)
     
-    def load_isochrone_data(self) -> Tuple[List[Dict], List[Dict]]:
-        """Load both 10min and 20min isochrone data from JSON files."""
-        with open(self.isochrone_10min_path, 'r') as f:
-            data_10min = json.load(f)
-        with open(self.isochrone_20min_path, 'r') as f:
-            data_20min = json.load(f)
-        return data_10min, data_20min
+    def load_isochrone_data(self, path: str) -> Iterator[Dict]:
+        """Stream the branches of an isochrone JSON file without their geometries."""
+        with open(path, 'rb') as f:
+            for location in ijson.items(f, 'item', use_float=True):
+                # Only the properties of the first feature are used for scoring
+                isochrone_data = location.pop('isochrone_data', None)
+                try:
+                    location['properties'] = isochrone_data['features'][0]['properties']
+                except (KeyError, IndexError, TypeError):
+                    location['properties'] = None
+                yield location
     
-    def calculate_population_score(self, inner_pop: float, outer_pop: float) -> float:
-        """Calculate population score using weighted inner and outer populations."""
+    def calculate_population_score(self, inner_pop: np.ndarray, outer_pop: np.ndarray) -> np.ndarray:
+        """Calculate population scores using weighted inner and outer populations (element-wise)."""
         # Normalize populations (using 25k for inner and 50k for outer as reference)
-        inner_score = min(inner_pop / 25000, 1.0) * self.INNER_WEIGHT
-        outer_score = min(outer_pop / 50000, 1.0) * self.OUTER_WEIGHT
+        inner_score = np.minimum(np.asarray(inner_pop, dtype=np.float64) / 25000, 1.0) * self.INNER_WEIGHT
+        outer_score = np.minimum(np.asarray(outer_pop, dtype=np.float64) / 50000, 1.0) * self.OUTER_WEIGHT
         
         # Combine scores (max possible is 1.0 + 0.5 = 1.5, so normalize to 1.0)
-        return min((inner_score + outer_score) / 1.5, 1.0)
+        return np.minimum((inner_score + outer_score) / 1.5, 1.0)
     
-    def calculate_scores(self) -> List[LocationScore]:
+    def calculate_scores(self) -> pd.DataFrame:
         """Calculate scores for each location based on isochrone data."""
-        data_10min, data_20min = self.load_isochrone_data()
         income_data = self.load_income_data()
         
-        # Create lookup dictionaries for faster access
-        data_10min_dict = {item['branch_id']: item for item in data_10min}
-        data_20min_dict = {item['branch_id']: item for item in data_20min}
-        
-        # Process all unique branch IDs
-        all_branch_ids = set(data_10min_dict.keys()) | set(data_20min_dict.keys())
+        # Index both time ranges by branch ID; the last record wins for duplicated IDs
+        data_10min_dict = {item['branch_id']: item for item in self.load_isochrone_data(self.isochrone_10min_path)}
+        data_20min_dict = {item['branch_id']: item for item in self.load_isochrone_data(self.isochrone_20min_path)}
         
-        for branch_id in all_branch_ids:
-            try:
-                # Get data for both time ranges
-                location_10min = data_10min_dict.get(branch_id)
-                location_20min = data_20min_dict.get(branch_id)
-                
-                if not location_10min or not location_20min:
-                    print(f"Skipping branch {branch_id}: Missing data for one or both time ranges")
-                    continue
-                
-                # Extract metrics
-                inner_pop = location_10min['isochrone_data']['features'][0]['properties'].get('total_pop', 0)
-                total_pop_20min = location_20min['isochrone_data']['features'][0]['properties'].get('total_pop', 0)
-                # Calculate outer ring population (20min area minus 10min area)
-                outer_pop = max(0, total_pop_20min - inner_pop)
-                
-                # Get area and reach factor from 20min isochrone
-                area = location_20min['isochrone_data']['features'][0]['properties'].get('area', 0)
-                reach_factor = location_20min['isochrone_data']['features'][0]['properties'].get('reachfactor', 0)
-                
-                # Get income data for the municipality
-                city = location_20min['city']
-                income = income_data.get(city, 0)
-                income_score = self.calculate_income_score(income)
-                
-                # Calculate population-income relationship score
-                pop_income_score = self.calculate_population_income_score(
-                    inner_pop, outer_pop, area, income
-                )
-                
-                # Calculate branch type score
-                branch_type = location_20min['branch_type']
-                branch_type_score = self.calculate_branch_type_score(branch_type)
-                
-                # Calculate population score
-                population_score = self.calculate_population_score(inner_pop, outer_pop)
-                
-                # Calculate area score
-                area_score = min(area / 75000000, 1.0)  # Normalize to 75km²
-                
-                # Calculate total score (weighted average)
-                total_score = (
-                    0.25 * population_score +     # Population weight: 25%
-                    0.2 * area_score +            # Area weight: 20%
-                    0.1 * reach_factor +          # Reach factor weight: 10%
-                    self.INCOME_WEIGHT * income_score +  # Income weight: 15%
-                    self.POP_INCOME_WEIGHT * pop_income_score +  # Population-income weight: 15%
-                    self.BRANCH_TYPE_WEIGHT * branch_type_score  # Branch type weight: 20%
-                )
-                
-                score = LocationScore(
-                    branch_id=branch_id,
-                    branch_name=location_20min['branch_name'],
-                    branch_type=branch_type,
-                    city=city,
-                    inner_population=inner_pop,
-                    outer_population=outer_pop,
-                    population_score=population_score,
-                    area_coverage=area_score,
-                    reach_factor=reach_factor,
-                    income_per_capita=income,
-                    income_score=income_score,
-                    pop_income_score=pop_income_score,
-                    branch_type_score=branch_type_score,
-                    total_score=total_score
-                )
-                
-                self.scores.append(score)
-                
-            except Exception as e:
-                print(f"Error processing branch {branch_id}: {str(e)}")
+        # Collect the raw metrics as one list per column; scoring is done on whole columns below
+        columns: Dict[str, list] = {name: [] for name in (
+            'branch_id', 'branch_name', 'branch_type', 'city',
+            'inner_population', 'total_pop_20min', 'area', 'reach_factor', 'has_identity'
+        )}
+        for branch_id, location_10min in data_10min_dict.items():
+            # Take the matching 20min record, so only unmatched ones are left afterwards
+            location_20min = data_20min_dict.pop(branch_id, None)
+            
+            if not location_20min:
+                print(f"Skipping branch {branch_id}: Missing data for one or both time ranges")
                 continue
+            
+            properties_10min = location_10min['properties'] or MISSING_PROPERTIES
+            properties_20min = location_20min['properties'] or MISSING_PROPERTIES
+            
+            row = (
+                branch_id,
+                location_20min.get('branch_name'),
+                location_20min.get('branch_type'),
+                location_20min.get('city'),
+                properties_10min.get('total_pop', 0),
+                properties_20min.get('total_pop', 0),
+                # Area and reach factor from the 20min isochrone
+                properties_20min.get('area', 0),
+                properties_20min.get('reachfactor', 0),
+                all(field in location_20min for field in IDENTITY_FIELDS)
+            )
+            for column, value in zip(columns.values(), row):
+                column.append(value)
+        
+        for branch_id in data_20min_dict:
+            print(f"Skipping branch {branch_id}: Missing data for one or both time ranges")
+        
+        inner_pop = np.array(columns['inner_population'], dtype=np.float64)
+        total_pop_20min = np.array(columns['total_pop_20min'], dtype=np.float64)
+        area = np.array(columns['area'], dtype=np.float64)
+        reach_factor = np.array(columns['reach_factor'], dtype=np.float64)
+        
+        # Missing metrics are NaN here; those branches and the ones lacking a
+        # branch field are dropped after scoring
+        valid = (np.isfinite(inner_pop) & np.isfinite(total_pop_20min)
+                 & np.isfinite(area) & np.isfinite(reach_factor)
+                 & np.array(columns['has_identity'], dtype=bool))
+        
+        # Calculate outer ring population (20min area minus 10min area)
+        outer_pop = np.maximum(0, total_pop_20min - inner_pop)
+        
+        # Get income data for the municipality, 0 where the municipality is unknown
+        income = income_data.reindex(columns['city'], fill_value=0).to_numpy(np.float64)
+        income_score = self.calculate_income_score(income)
+        
+        # Calculate population-income relationship score
+        pop_income_score = self.calculate_population_income_score(inner_pop, outer_pop, area, income)
+        
+        # Calculate branch type score once per distinct branch type, scoring
+        # missing types like unknown ones
+        branch_type = np.array(['' if t is None else t for t in columns['branch_type']], dtype=object)
+        type_codes, branch_types = pd.factorize(branch_type, use_na_sentinel=False)
+        type_scores = np.array(
+            [self.calculate_branch_type_score(branch_type) for branch_type in branch_types],
+            dtype=np.float64
+        )
+        branch_type_score = type_scores[type_codes]
+        
+        # Calculate population score
+        population_score = self.calculate_population_score(inner_pop, outer_pop)
+        
+        # Calculate area score
+        area_score = np.minimum(area / 75000000, 1.0)  # Normalize to 75km²
+        
+        # Calculate total score (weighted average)
+        total_score = (
+            0.25 * population_score +     # Population weight: 25%
+            0.2 * area_score +            # Area weight: 20%
+            0.1 * reach_factor +          # Reach factor weight: 10%
+            self.INCOME_WEIGHT * income_score +  # Income weight: 15%
+            self.POP_INCOME_WEIGHT * pop_income_score +  # Population-income weight: 15%
+            self.BRANCH_TYPE_WEIGHT * branch_type_score  # Branch type weight: 20%
+        )
+        
+        scores_df = pd.DataFrame({
+            'branch_id': columns['branch_id'],
+            'branch_name': columns['branch_name'],
+            'branch_type': branch_type,
+            'city': columns['city'],
+            'inner_population': inner_pop,
+            'outer_population': outer_pop,
+            'population_score': population_score,
+            'area_coverage': area_score,
+            'reach_factor': reach_factor,
+            'income_per_capita': income,
+            'income_score': income_score,
+            'pop_income_score': pop_income_score,
+            'branch_type_score': branch_type_score,
+            'total_score': total_score
+        })
+        
+        if not valid.all():
+            invalid_ids = scores_df.loc[~valid, 'branch_id'].tolist()
+            print(f"Skipping {len(invalid_ids)} branches with missing isochrone metrics or branch fields: {invalid_ids}")
+            scores_df = scores_df.loc[valid].reset_index(drop=True)
+        
+        self.scores = scores_df
         
         return self.scores
     
-    def save_scores(self, output_path: str):
-        """Save the calculated scores to a CSV file."""
-        # Convert scores to DataFrame
-        scores_df = pd.DataFrame([
-            {
-                'branch_id': score.branch_id,
-                'branch_name': score.branch_name,
-                'branch_type': score.branch_type,
-                'city': score.city,
-                'inner_population': score.inner_population,
-                'outer_population': score.outer_population,
-                'population_score': score.population_score,
-                'area_coverage': score.area_coverage,
-                'reach_factor': score.reach_factor,
-                'income_per_capita': score.income_per_capita,
-                'income_score': score.income_score,
-                'pop_income_score': score.pop_income_score,
-                'branch_type_score': score.branch_type_score,
-                'total_score': score.total_score
-            }
-            for score in self.scores
-        ])
-        
-        # Save to CSV
-        scores_df.to_csv(output_path, index=False)
+    def __iter__(self) -> Iterator[LocationScore]:
+        """Iterate over the calculated scores as LocationScore records (kept for callers of the old list API)."""
+        return (LocationScore(*row) for row in self.scores.itertuples(index=False, name=None))
+    
+    def save_scores(self, output_path: str, csv_path: Optional[str] = None):
+        """Save the calculated scores to a Parquet file, optionally also as CSV."""
+        self.scores.to_parquet(output_path, compression='zstd', index=False)
         print(f"Scores saved to {output_path}")
+        
+        # Keep a CSV copy for inspection and the visualization scripts
+        if csv_path:
+            pv.write_csv(pa.Table.from_pandas(self.scores, preserve_index=False), csv_path)
+            print(f"Scores saved to {csv_path}")
 
 def analyze_locations():
     """Main function to analyze and score locations."""
@@ -250,40 +278,45 @@ def analyze_locations():
     scorer = LocationScorer(
         '../output/isochrone_results_10min.json',
         '../output/isochrone_results_20min.json',
-        '../output/processed_income_data.csv'
+        '../output/processed_income_data.parquet'
     )
     
     # Calculate scores
     scores = scorer.calculate_scores()
     
     # Save results
-    output_path = '../output/location_scores.csv'
-    scorer.save_scores(output_path)
+    output_path = '../output/location_scores.parquet'
+    scorer.save_scores(output_path, csv_path='../output/location_scores.csv')
     
     # Print summary statistics
-    if scores:
-        total_scores = [score.total_score for score in scores]
+    if not scores.empty:
+        total_scores = scores['total_score'].to_numpy()
         print("\nSummary Statistics:")
         print(f"Number of locations analyzed: {len(scores)}")
-        print(f"Average score: {np.mean(total_scores):.2f}")
-        print(f"Minimum score: {min(total_scores):.2f}")
-        print(f"Maximum score: {max(total_scores):.2f}")
+        print(f"Average score: {total_scores.mean():.2f}")
+        print(f"Minimum score: {total_scores.min():.2f}")
+        print(f"Maximum score: {total_scores.max():.2f}")
         
         # Print top 20 locations with detailed scores
         print("\nTop 20 Locations:")
-        top_scores = sorted(scores, key=lambda x: x.total_score, reverse=True)[:20]
+        top_scores = scores.nlargest(20, 'total_score').itertuples(index=False)
+        report = []
         for score in top_scores:
-            print(f"\n{score.branch_name} ({score.city}):")
-            print(f"  Total Score: {score.total_score:.2f}")
-            print(f"  Branch Type: {score.branch_type} (Score: {score.branch_type_score:.2f})")
-            print(f"  Inner Population (0-10min): {score.inner_population:,.0f}")
-            print(f"  Outer Population (10-20min): {score.outer_population:,.0f}")
-            print(f"  Population Score: {score.population_score:.2f}")
-            print(f"  Area Coverage: {score.area_coverage:.2f}")
-            print(f"  Reach Factor: {score.reach_factor:.2f}")
-            print(f"  Income per Capita: {score.income_per_capita:,.0f}")
-            print(f"  Income Score: {score.income_score:.2f}")
-            print(f"  Population-Income Score: {score.pop_income_score:.2f}")
+            report.extend([
+                f"\n{score.branch_name} ({score.city}):",
+                f"  Total Score: {score.total_score:.2f}",
+                f"  Branch Type: {score.branch_type} (Score: {score.branch_type_score:.2f})",
+                f"  Inner Population (0-10min): {score.inner_population:,.0f}",
+                f"  Outer Population (10-20min): {score.outer_population:,.0f}",
+                f"  Population Score: {score.population_score:.2f}",
+                f"  Area Coverage: {score.area_coverage:.2f}",
+                f"  Reach Factor: {score.reach_factor:.2f}",
+                f"  Income per Capita: {score.income_per_capita:,.0f}",
+                f"  Income Score: {score.income_score:.2f}",
+                f"  Population-Income Score: {score.pop_income_score:.2f}"
+            ])
+        # Print the report in one write
+        print("\n".join(report))
 
 if __name__ == "__main__":
     analyze_locations() 
\ No newline at end of file
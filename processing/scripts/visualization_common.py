@@ -0,0 +1,58 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import folium
+import json
+import os
+
+MERGED_CACHE = '../output/.cache/merged.parquet'
+# Parquet metadata key holding the sources the cached merge was built from
+CACHE_SOURCES_KEY = b'merged_sources'
+
+def _sources_key(scores_path: str, geo_path: str) -> bytes:
+    """Identify the source files by absolute path and modification time."""
+    return json.dumps([
+        [os.path.abspath(path), os.stat(path).st_mtime_ns]
+        for path in (scores_path, geo_path)
+    ]).encode()
+
+def load_merged(scores_path: str, geo_path: str) -> pd.DataFrame:
+    """Load the scores merged with branch coordinates, reusing the Parquet cache while it is fresh."""
+    sources_key = _sources_key(scores_path, geo_path)
+    if os.path.exists(MERGED_CACHE):
+        metadata = pq.read_schema(MERGED_CACHE).metadata or {}
+        if metadata.get(CACHE_SOURCES_KEY) == sources_key:
+            return pd.read_parquet(MERGED_CACHE, engine='pyarrow')
+    
+    scores_df = pd.read_csv(scores_path)
+    
+    # Load geospatial data
+    geospatial_df = pd.read_csv(
+        geo_path,
+        usecols=['id', 'latitude', 'longitude'],
+        dtype={'id': 'int64', 'latitude': 'float64', 'longitude': 'float64'}
+    )
+    
+    # Merge the dataframes
+    merged_df = pd.merge(
+        scores_df,
+        geospatial_df[['id', 'latitude', 'longitude']],
+        left_on='branch_id',
+        right_on='id',
+        how='left'
+    )
+    
+    # Record the sources next to the pandas metadata so a cache built from
+    # other or older files is never reused
+    table = pa.Table.from_pandas(merged_df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, CACHE_SOURCES_KEY: sources_key})
+    
+    os.makedirs(os.path.dirname(MERGED_CACHE), exist_ok=True)
+    tmp_file = MERGED_CACHE + '.tmp'
+    pq.write_table(table, tmp_file)
+    os.replace(tmp_file, MERGED_CACHE)
+    return merged_df
+
+def base_map() -> folium.Map:
+    """Create an empty map centered on Switzerland."""
+    return folium.Map(location=[46.8182, 8.2275], zoom_start=8)
@@ -8,6 +8,7 @@ import os
 from typing import List, Dict, Tuple
 from dataclasses import dataclass
 import json
+from visualization_common import base_map, load_merged
 
 @dataclass
 class ServiceArea:
@@ -27,31 +28,28 @@ class PilotAreaVisualizer:
             'VOI': '#F333FF'   # Purple
         }
         
-    def load_data(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    def load_data(self) -> pd.DataFrame:
         """Load scoring and geospatial data."""
-        scores_df = pd.read_csv('../output/location_scores.csv')
-        geo_df = pd.read_csv('../output/geospatial_branches_data.csv')
+        merged_df = load_merged('../output/location_scores.csv',
+                                 '../output/geospatial_branches_data.csv')
+        merged_df = merged_df[['branch_id', 'branch_name', 'branch_type', 'inner_population',
+                               'outer_population', 'income_per_capita', 'total_score',
+                               'id', 'latitude', 'longitude']].copy()
         
         # Calculate inner and outer radii (assuming average cycling speed of 15 km/h)
         # 10 minutes = 2.5 km, 20 minutes = 5 km
-        geo_df['radius_10min'] = 2.5  # km
-        geo_df['radius_20min'] = 5.0  # km
+        merged_df['radius_10min'] = 2.5  # km
+        merged_df['radius_20min'] = 5.0  # km
         
-        # Merge data
-        merged_df = pd.merge(
-            scores_df,
-            geo_df[['id', 'latitude', 'longitude', 'radius_10min', 'radius_20min']],
-            left_on='branch_id',
-            right_on='id',
-            how='left'
-        )
-        
-        return merged_df, geo_df
+        return merged_df
     
-    def create_service_area_map(self, selected_branches: pd.DataFrame, output_dir: str):
-        """Create an interactive map showing service areas of selected branches."""
-        # Create base map centered on Switzerland
-        m = folium.Map(location=[46.8182, 8.2275], zoom_start=8)
+    def create_pilot_maps(self, selected_branches: pd.DataFrame, output_dir: str):
+        """Create the service area, coverage, income and branch type maps in one pass over the branches."""
+        # Create base maps centered on Switzerland
+        service_map = base_map()
+        heatmap_map = base_map()
+        income_map = base_map()
+        type_map = base_map()
         
         # Create colormap for scores
         score_colormap = cm.LinearColormap(
@@ -59,134 +57,125 @@ class PilotAreaVisualizer:
             vmin=selected_branches['total_score'].min(),
             vmax=selected_branches['total_score'].max()
         )
-        score_colormap.add_to(m)
+        score_colormap.add_to(service_map)
         
-        # Add each branch and its service areas
-        for _, branch in selected_branches.iterrows():
-            # Create popup with branch information
-            popup_text = f"""
-            <b>{branch['branch_name']}</b><br>
-            Type: {branch['branch_type']}<br>
-            Score: {branch['total_score']:.2f}<br>
-            Population (10min): {branch['inner_population']:.0f}<br>
-            Population (20min): {branch['outer_population']:.0f}<br>
-            Income: {branch['income_per_capita']:.0f} CHF
-            """
+        # Create colormap for income levels
+        income_colormap = cm.LinearColormap(
+            colors=['blue', 'green', 'yellow', 'red'],
+            vmin=selected_branches['income_per_capita'].min(),
+            vmax=selected_branches['income_per_capita'].max()
+        )
+        income_colormap.add_to(income_map)
+        
+        # Add each branch to the service area, income and branch type maps
+        branch_colors = selected_branches['branch_type'].map(self.colors).fillna('gray').to_numpy()
+        
+        # Format the popup texts for all branches up front
+        name = selected_branches['branch_name'].astype(str)
+        branch_type = selected_branches['branch_type'].astype(str)
+        score = selected_branches['total_score'].map('{:.2f}'.format)
+        inner_population = selected_branches['inner_population'].map('{:.0f}'.format)
+        outer_population = selected_branches['outer_population'].map('{:.0f}'.format)
+        income = selected_branches['income_per_capita'].map('{:.0f}'.format)
+        popup_texts = (
+            '\n            <b>' + name + '</b><br>'
+            '\n            Type: ' + branch_type + '<br>'
+            '\n            Score: ' + score + '<br>'
+            '\n            Population (10min): ' + inner_population + '<br>'
+            '\n            Population (20min): ' + outer_population + '<br>'
+            '\n            Income: ' + income + ' CHF'
+            '\n            '
+        ).to_numpy()
+        income_popup_texts = (
+            '\n            <b>' + name + '</b><br>'
+            '\n            Income: ' + income + ' CHF<br>'
+            '\n            Population: ' + inner_population +
+            '\n            '
+        ).to_numpy()
+        type_popup_texts = (
+            '\n            <b>' + name + '</b><br>'
+            '\n            Type: ' + branch_type + '<br>'
+            '\n            Score: ' + score +
+            '\n            '
+        ).to_numpy()
+        
+        for branch, color, popup_text, income_popup_text, type_popup_text in zip(
+            selected_branches.itertuples(index=False), branch_colors,
+            popup_texts, income_popup_texts, type_popup_texts
+        ):
+            location = [branch.latitude, branch.longitude]
             
             # Add inner service area (10min)
             folium.Circle(
-                location=[branch['latitude'], branch['longitude']],
-                radius=branch['radius_10min'] * 1000,  # Convert to meters
-                color=self.colors.get(branch['branch_type'], 'gray'),
+                location=location,
+                radius=branch.radius_10min * 1000,  # Convert to meters
+                color=color,
                 fill=True,
                 fill_opacity=0.2,
                 popup=folium.Popup(popup_text, max_width=300)
-            ).add_to(m)
+            ).add_to(service_map)
             
             # Add outer service area (20min)
             folium.Circle(
-                location=[branch['latitude'], branch['longitude']],
-                radius=branch['radius_20min'] * 1000,  # Convert to meters
-                color=self.colors.get(branch['branch_type'], 'gray'),
+                location=location,
+                radius=branch.radius_20min * 1000,  # Convert to meters
+                color=color,
                 fill=True,
                 fill_opacity=0.1,
                 popup=folium.Popup(popup_text, max_width=300)
-            ).add_to(m)
+            ).add_to(service_map)
             
             # Add branch marker
             folium.CircleMarker(
-                location=[branch['latitude'], branch['longitude']],
+                location=location,
                 radius=8,
-                color=self.colors.get(branch['branch_type'], 'gray'),
+                color=color,
                 fill=True,
                 fill_opacity=0.7,
                 popup=folium.Popup(popup_text, max_width=300)
-            ).add_to(m)
-        
-        # Add layer control
-        folium.LayerControl().add_to(m)
-        
-        # Save the map
-        m.save(os.path.join(output_dir, 'pilot_service_areas.html'))
-    
-    def create_coverage_heatmap(self, selected_branches: pd.DataFrame, output_dir: str):
-        """Create a heatmap showing population coverage."""
-        m = folium.Map(location=[46.8182, 8.2275], zoom_start=8)
-        
-        # Create heatmap data
-        heat_data = []
-        for _, branch in selected_branches.iterrows():
-            # Add points for inner radius with higher weight
-            heat_data.extend([
-                [branch['latitude'], branch['longitude'], branch['inner_population']]
-                for _ in range(10)  # More points for inner radius
-            ])
-            # Add points for outer radius with lower weight
-            heat_data.extend([
-                [branch['latitude'], branch['longitude'], branch['outer_population'] * 0.5]
-                for _ in range(5)  # Fewer points for outer radius
-            ])
-        
-        # Add heatmap layer
-        HeatMap(heat_data, radius=15, blur=10).add_to(m)
-        
-        # Save the map
-        m.save(os.path.join(output_dir, 'pilot_coverage_heatmap.html'))
-    
-    def create_income_distribution_map(self, selected_branches: pd.DataFrame, output_dir: str):
-        """Create a map showing income distribution in service areas."""
-        m = folium.Map(location=[46.8182, 8.2275], zoom_start=8)
-        
-        # Create colormap for income levels
-        income_colormap = cm.LinearColormap(
-            colors=['blue', 'green', 'yellow', 'red'],
-            vmin=selected_branches['income_per_capita'].min(),
-            vmax=selected_branches['income_per_capita'].max()
-        )
-        income_colormap.add_to(m)
-        
-        # Add each branch with income-based coloring
-        for _, branch in selected_branches.iterrows():
-            popup_text = f"""
-            <b>{branch['branch_name']}</b><br>
-            Income: {branch['income_per_capita']:.0f} CHF<br>
-            Population: {branch['inner_population']:.0f}
-            """
+            ).add_to(service_map)
             
+            # Add inner service area with income-based coloring
             folium.Circle(
-                location=[branch['latitude'], branch['longitude']],
-                radius=branch['radius_10min'] * 1000,
-                color=income_colormap(branch['income_per_capita']),
+                location=location,
+                radius=branch.radius_10min * 1000,
+                color=income_colormap(branch.income_per_capita),
                 fill=True,
                 fill_opacity=0.3,
-                popup=folium.Popup(popup_text, max_width=300)
-            ).add_to(m)
-        
-        # Save the map
-        m.save(os.path.join(output_dir, 'pilot_income_distribution.html'))
-    
-    def create_branch_type_map(self, selected_branches: pd.DataFrame, output_dir: str):
-        """Create a map showing distribution of branch types."""
-        m = folium.Map(location=[46.8182, 8.2275], zoom_start=8)
-        
-        # Add each branch with type-based coloring
-        for _, branch in selected_branches.iterrows():
-            popup_text = f"""
-            <b>{branch['branch_name']}</b><br>
-            Type: {branch['branch_type']}<br>
-            Score: {branch['total_score']:.2f}
-            """
+                popup=folium.Popup(income_popup_text, max_width=300)
+            ).add_to(income_map)
             
+            # Add branch marker with type-based coloring
             folium.CircleMarker(
-                location=[branch['latitude'], branch['longitude']],
+                location=location,
                 radius=10,
-                color=self.colors.get(branch['branch_type'], 'gray'),
+                color=color,
                 fill=True,
                 fill_opacity=0.7,
-                popup=folium.Popup(popup_text, max_width=300)
-            ).add_to(m)
+                popup=folium.Popup(type_popup_text, max_width=300)
+            ).add_to(type_map)
+        
+        # Add layer control
+        folium.LayerControl().add_to(service_map)
+        
+        # Create heatmap data
+        # Bin the branches to a ~1 km grid so the heatmap gets one point per cell.
+        # The heatmap sums the weights of points in the same spot, so the inner radius
+        # counts 10x its population and the outer radius 5x half of its population
+        cells = selected_branches.assign(
+            lat_bin=(selected_branches['latitude'] * 100).round(),
+            lon_bin=(selected_branches['longitude'] * 100).round()
+        ).groupby(['lat_bin', 'lon_bin'])[['inner_population', 'outer_population']].sum().reset_index()
+        heat_data = np.column_stack([
+            cells['lat_bin'] / 100,
+            cells['lon_bin'] / 100,
+            cells['inner_population'] * 10 + cells['outer_population'] * (5 * 0.5)
+        ]).tolist()
         
-        # Add legend
+        # Add heatmap layer
+        HeatMap(heat_data, radius=15, blur=10).add_to(heatmap_map)
+        
+        # Add branch type legend
         legend_html = """
         <div style="position: fixed; bottom: 50px; left: 50px; z-index: 1000; background-color: white; padding: 10px; border: 2px solid grey; border-radius: 5px">
         <p><strong>Branch Types</strong></p>
@@ -194,10 +183,13 @@ class PilotAreaVisualizer:
         for branch_type, color in self.colors.items():
             legend_html += f'<p><span style="color:{color}">●</span> {branch_type}</p>'
         legend_html += '</div>'
-        m.get_root().html.add_child(folium.Element(legend_html))
+        type_map.get_root().html.add_child(folium.Element(legend_html))
         
-        # Save the map
-        m.save(os.path.join(output_dir, 'pilot_branch_types.html'))
+        # Save the maps
+        service_map.save(os.path.join(output_dir, 'pilot_service_areas.html'))
+        heatmap_map.save(os.path.join(output_dir, 'pilot_coverage_heatmap.html'))
+        income_map.save(os.path.join(output_dir, 'pilot_income_distribution.html'))
+        type_map.save(os.path.join(output_dir, 'pilot_branch_types.html'))
 
 def main():
     # Create output directory
@@ -209,7 +201,7 @@ def main():
     
     # Load data
     print("Loading branch data...")
-    merged_df, _ = visualizer.load_data()
+    merged_df = visualizer.load_data()
     
     # Load selected branches from pilot selection
     try:
@@ -221,17 +213,8 @@ def main():
         selected_branches = merged_df
     
     # Create visualizations
-    print("Creating service area map...")
-    visualizer.create_service_area_map(selected_branches, output_dir)
-    
-    print("Creating coverage heatmap...")
-    visualizer.create_coverage_heatmap(selected_branches, output_dir)
-    
-    print("Creating income distribution map...")
-    visualizer.create_income_distribution_map(selected_branches, output_dir)
-    
-    print("Creating branch type map...")
-    visualizer.create_branch_type_map(selected_branches, output_dir)
+    print("Creating service area, coverage, income distribution and branch type maps...")
+    visualizer.create_pilot_maps(selected_branches, output_dir)
     
     print(f"\nVisualizations saved to {output_dir}/")
     print("Generated files:")
@@ -1,30 +1,23 @@
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
 import os
+from concurrent.futures import ProcessPoolExecutor
 import folium
 from folium.plugins import HeatMap
 import branca.colormap as cm
+from visualization_common import base_map, load_merged
+
+# Resolution of the saved PNG plots
+PLOT_DPI = 90
 
 def load_scores(file_path: str) -> pd.DataFrame:
-    """Load the scoring results from CSV."""
-    scores_df = pd.read_csv(file_path)
-    
-    # Load geospatial data
-    geospatial_df = pd.read_csv('../output/geospatial_branches_data.csv')
-    
-    # Merge the dataframes
-    merged_df = pd.merge(
-        scores_df,
-        geospatial_df[['id', 'latitude', 'longitude']],
-        left_on='branch_id',
-        right_on='id',
-        how='left'
-    )
-    
-    return merged_df
+    """Load the scoring results merged with the branch coordinates."""
+    return load_merged(file_path, '../output/geospatial_branches_data.csv')
 
 def create_score_distribution_plot(df: pd.DataFrame, output_dir: str):
     """Create a distribution plot of total scores."""
@@ -33,7 +26,7 @@ def create_score_distribution_plot(df: pd.DataFrame, output_dir: str):
     plt.title('Distribution of Location Scores')
     plt.xlabel('Total Score')
     plt.ylabel('Number of Locations')
-    plt.savefig(os.path.join(output_dir, 'score_distribution.png'))
+    plt.savefig(os.path.join(output_dir, 'score_distribution.png'), dpi=PLOT_DPI)
     plt.close()
 
 def create_score_components_plot(df: pd.DataFrame, output_dir: str):
@@ -44,14 +37,13 @@ def create_score_components_plot(df: pd.DataFrame, output_dir: str):
     ]
     
     plt.figure(figsize=(15, 8))
-    df_melted = pd.melt(df[score_components])
-    sns.boxplot(data=df_melted, x='variable', y='value')
+    plt.boxplot([df[c].dropna().to_numpy() for c in score_components], tick_labels=score_components)
     plt.title('Distribution of Score Components')
     plt.xlabel('Score Component')
     plt.ylabel('Score Value')
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'score_components.png'))
+    plt.savefig(os.path.join(output_dir, 'score_components.png'), dpi=PLOT_DPI)
     plt.close()
 
 def create_branch_type_analysis(df: pd.DataFrame, output_dir: str):
@@ -65,7 +57,7 @@ def create_branch_type_analysis(df: pd.DataFrame, output_dir: str):
     plt.ylabel('Average Score')
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'branch_type_scores.png'))
+    plt.savefig(os.path.join(output_dir, 'branch_type_scores.png'), dpi=PLOT_DPI)
     plt.close()
     
     # Branch type distribution
@@ -74,7 +66,7 @@ def create_branch_type_analysis(df: pd.DataFrame, output_dir: str):
     plt.title('Distribution of Branch Types')
     plt.ylabel('')
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'branch_type_distribution.png'))
+    plt.savefig(os.path.join(output_dir, 'branch_type_distribution.png'), dpi=PLOT_DPI)
     plt.close()
 
 def create_correlation_heatmap(df: pd.DataFrame, output_dir: str):
@@ -89,13 +81,17 @@ def create_correlation_heatmap(df: pd.DataFrame, output_dir: str):
     sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', center=0)
     plt.title('Correlation between Score Components')
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'score_correlations.png'))
+    plt.savefig(os.path.join(output_dir, 'score_correlations.png'), dpi=PLOT_DPI)
     plt.close()
 
 def create_top_locations_analysis(df: pd.DataFrame, output_dir: str):
     """Create visualizations for top scoring locations."""
-    # Get top 20 locations
-    top_20 = df.nlargest(20, 'total_score')
+    # Get top 20 locations, partitioning instead of sorting all scores
+    scores = df['total_score'].to_numpy()
+    k = min(20, len(scores))
+    top_idx = np.argpartition(-scores, k - 1)[:k]
+    top_idx = top_idx[np.argsort(-scores[top_idx], kind='stable')]
+    top_20 = df.iloc[top_idx]
     
     # Create radar chart for top 5 locations
     score_components = [
@@ -114,11 +110,11 @@ def create_top_locations_analysis(df: pd.DataFrame, output_dir: str):
     fig, ax = plt.subplots(figsize=(15, 15), subplot_kw=dict(projection='polar'))
     
     # Plot top 5 locations
-    for i, (_, location) in enumerate(top_20.head(5).iterrows()):
-        values = location[score_components].values
+    top_5 = top_20.head(5)
+    for branch_name, values in zip(top_5['branch_name'], top_5[score_components].to_numpy()):
         values = np.concatenate((values, [values[0]]))  # Close the loop
         
-        ax.plot(angles, values, linewidth=2, label=location['branch_name'])
+        ax.plot(angles, values, linewidth=2, label=branch_name)
         ax.fill(angles, values, alpha=0.1)
     
     # Set labels
@@ -127,7 +123,7 @@ def create_top_locations_analysis(df: pd.DataFrame, output_dir: str):
     plt.title('Score Components for Top 5 Locations')
     plt.legend(loc='upper right', bbox_to_anchor=(0.3, 0.3))
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'top_locations_radar.png'))
+    plt.savefig(os.path.join(output_dir, 'top_locations_radar.png'), dpi=PLOT_DPI)
     plt.close()
     
     # Create bar chart of top 20 locations
@@ -138,7 +134,7 @@ def create_top_locations_analysis(df: pd.DataFrame, output_dir: str):
     plt.ylabel('Total Score')
     plt.xticks(rotation=45, ha='right')
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'top_20_locations.png'))
+    plt.savefig(os.path.join(output_dir, 'top_20_locations.png'), dpi=PLOT_DPI)
     plt.close()
 
 def create_income_population_analysis(df: pd.DataFrame, output_dir: str):
@@ -146,12 +142,12 @@ def create_income_population_analysis(df: pd.DataFrame, output_dir: str):
     # Scatter plot of income vs population
     plt.figure(figsize=(12, 8))
     sns.scatterplot(data=df, x='inner_population', y='income_per_capita', 
-                   hue='total_score', size='total_score', sizes=(20, 200))
+                   hue='total_score', size='total_score', sizes=(20, 200), rasterized=True)
     plt.title('Income vs Population (Inner Ring)')
     plt.xlabel('Inner Population (0-10 min)')
     plt.ylabel('Income per Capita')
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'income_vs_population.png'))
+    plt.savefig(os.path.join(output_dir, 'income_vs_population.png'), dpi=PLOT_DPI)
     plt.close()
     
     # Population distribution by branch type
@@ -162,44 +158,72 @@ def create_income_population_analysis(df: pd.DataFrame, output_dir: str):
     plt.ylabel('Inner Population (0-10 min)')
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'population_by_branch_type.png'))
+    plt.savefig(os.path.join(output_dir, 'population_by_branch_type.png'), dpi=PLOT_DPI)
     plt.close()
 
 def create_geographic_analysis(df: pd.DataFrame, output_dir: str):
     """Create geographic visualizations of branch locations and scores."""
     # Create a base map centered on Switzerland
-    m = folium.Map(location=[46.8182, 8.2275], zoom_start=8)
+    m = base_map()
     
     # Create a colormap for the scores
+    vmin = df['total_score'].min()
+    vmax = df['total_score'].max()
     colormap = cm.LinearColormap(
         colors=['red', 'yellow', 'green'],
-        vmin=df['total_score'].min(),
-        vmax=df['total_score'].max()
+        vmin=vmin,
+        vmax=vmax
     )
     
-    # Add branch locations with popups
-    for _, row in df.iterrows():
-        if pd.isna(row['latitude']) or pd.isna(row['longitude']):
-            continue
-            
+    # Only branches with coordinates can be placed on the maps
+    located = df.dropna(subset=['latitude', 'longitude'])
+    
+    # Look the score colors up in a 256-step table instead of interpolating per branch
+    lut = [colormap(b) for b in np.linspace(vmin, vmax, 256)]
+    score_bins = ((located['total_score'].to_numpy() - vmin) / ((vmax - vmin) or 1) * 255).astype(int)
+    score_colors = [lut[i] for i in np.minimum(score_bins, 255)]
+    
+    # Build one GeoJSON feature per branch so each map gets a single layer
+    # instead of one folium marker per branch
+    type_colors = {
+        'm': 'blue',
+        'mm': 'green',
+        'mmm': 'red',
+        'voi': 'purple'
+    }
+    features = []
+    for row, score_color in zip(located.itertuples(index=False), score_colors):
         popup_text = f"""
-        <b>{row['branch_name']}</b><br>
-        Type: {row['branch_type']}<br>
-        Score: {row['total_score']:.2f}<br>
-        Population (10min): {row['inner_population']:.0f}<br>
-        Population (20min): {row['outer_population']:.0f}<br>
-        Income: {row['income_per_capita']:.0f} CHF
+        <b>{row.branch_name}</b><br>
+        Type: {row.branch_type}<br>
+        Score: {row.total_score:.2f}<br>
+        Population (10min): {row.inner_population:.0f}<br>
+        Population (20min): {row.outer_population:.0f}<br>
+        Income: {row.income_per_capita:.0f} CHF
         """
-        
-        folium.CircleMarker(
-            location=[row['latitude'], row['longitude']],
-            radius=8,
-            popup=folium.Popup(popup_text, max_width=300),
-            color=colormap(row['total_score']),
-            fill=True,
-            fill_color=colormap(row['total_score']),
-            fill_opacity=0.7
-        ).add_to(m)
+        features.append({
+            'type': 'Feature',
+            'id': row.branch_id,
+            'geometry': {'type': 'Point', 'coordinates': [row.longitude, row.latitude]},
+            'properties': {
+                'popup': popup_text,
+                'type_popup': f"{row.branch_name} ({row.branch_type})",
+                'score_color': score_color,
+                'type_color': type_colors.get(row.branch_type, 'gray'),
+            },
+        })
+    branches = {'type': 'FeatureCollection', 'features': features}
+    
+    # Add branch locations with popups
+    folium.GeoJson(
+        branches,
+        marker=folium.CircleMarker(radius=8, fill=True, fill_opacity=0.7),
+        style_function=lambda f: {
+            'color': f['properties']['score_color'],
+            'fillColor': f['properties']['score_color'],
+        },
+        popup=folium.GeoJsonPopup(fields=['popup'], labels=False, localize=False, max_width=300),
+    ).add_to(m)
     
     # Add the colormap to the map
     colormap.add_to(m)
@@ -208,37 +232,21 @@ def create_geographic_analysis(df: pd.DataFrame, output_dir: str):
     m.save(os.path.join(output_dir, 'branch_locations.html'))
     
     # Create a heatmap of branch scores
-    heat_data = [[row['latitude'], row['longitude'], row['total_score']] 
-                 for _, row in df.iterrows()
-                 if not pd.isna(row['latitude']) and not pd.isna(row['longitude'])]
+    heat_data = located[['latitude', 'longitude', 'total_score']].to_numpy(dtype=float).tolist()
     
-    m_heat = folium.Map(location=[46.8182, 8.2275], zoom_start=8)
+    m_heat = base_map()
     HeatMap(heat_data).add_to(m_heat)
     m_heat.save(os.path.join(output_dir, 'score_heatmap.html'))
     
     # Create branch type distribution map
-    m_types = folium.Map(location=[46.8182, 8.2275], zoom_start=8)
-    
-    # Define colors for different branch types
-    type_colors = {
-        'm': 'blue',
-        'mm': 'green',
-        'mmm': 'red',
-        'voi': 'purple'
-    }
+    m_types = base_map()
     
-    for _, row in df.iterrows():
-        if pd.isna(row['latitude']) or pd.isna(row['longitude']):
-            continue
-            
-        folium.CircleMarker(
-            location=[row['latitude'], row['longitude']],
-            radius=8,
-            popup=f"{row['branch_name']} ({row['branch_type']})",
-            color=type_colors.get(row['branch_type'], 'gray'),
-            fill=True,
-            fill_opacity=0.7
-        ).add_to(m_types)
+    folium.GeoJson(
+        branches,
+        marker=folium.CircleMarker(radius=8, fill=True, fill_opacity=0.7),
+        style_function=lambda f: {'color': f['properties']['type_color']},
+        popup=folium.GeoJsonPopup(fields=['type_popup'], labels=False, localize=False),
+    ).add_to(m_types)
     
     m_types.save(os.path.join(output_dir, 'branch_types.html'))
 
@@ -250,28 +258,28 @@ def main():
     # Load scoring data
     df = load_scores('../output/location_scores.csv')
     
-    # Create geographic visualizations
-    print("Creating geographic analysis...")
-    create_geographic_analysis(df, output_dir)
-    
-    # Create other visualizations
-    print("Creating score distribution plot...")
-    create_score_distribution_plot(df, output_dir)
-    
-    print("Creating score components plot...")
-    create_score_components_plot(df, output_dir)
-    
-    print("Creating branch type analysis...")
-    create_branch_type_analysis(df, output_dir)
-    
-    print("Creating correlation heatmap...")
-    create_correlation_heatmap(df, output_dir)
-    
-    print("Creating top locations analysis...")
-    create_top_locations_analysis(df, output_dir)
+    plots = [
+        ("score distribution plot", create_score_distribution_plot),
+        ("score components plot", create_score_components_plot),
+        ("branch type analysis", create_branch_type_analysis),
+        ("correlation heatmap", create_correlation_heatmap),
+        ("top locations analysis", create_top_locations_analysis),
+        ("income-population analysis", create_income_population_analysis),
+    ]
     
-    print("Creating income-population analysis...")
-    create_income_population_analysis(df, output_dir)
+    # The matplotlib plots are independent, so render them in worker processes
+    # while the geographic maps are built here
+    with ProcessPoolExecutor() as executor:
+        futures = []
+        for label, plot in plots:
+            print(f"Creating {label}...")
+            futures.append(executor.submit(plot, df, output_dir))
+        
+        print("Creating geographic analysis...")
+        create_geographic_analysis(df, output_dir)
+        
+        for future in futures:
+            future.result()
     
     print(f"\nAll visualizations have been saved to {output_dir}")
 